@@ -0,0 +1,108 @@
+import os
+import sys
+import csv
+import time
+import queue
+import argparse
+import multiprocessing
+from engine import Board, ChessAI, move_name
+from pgn import read_games
+
+RESULT_FIELDS = ['index', 'fen', 'move', 'score', 'depth', 'nodes', 'seconds', 'error']
+
+worker_ai = None # one engine per worker process, kept warm (transposition table included) between positions
+
+def start_worker(depth, hash_mb, backend):
+    global worker_ai
+    worker_ai = ChessAI('white', depth=depth, hash_mb=hash_mb, backend=backend)
+
+def error_result(index, fen, error):
+    result = dict.fromkeys(RESULT_FIELDS)
+    result.update(index=index, fen=fen, error=f'{type(error).__name__}: {error}')
+    return result
+
+# best move and score (from white's side) of one FEN; runs in a worker process
+def analyse_position(job):
+    index, fen, move_time = job
+    result = dict.fromkeys(RESULT_FIELDS)
+    result.update(index=index, fen=fen)
+    try:
+        board = Board.from_fen(fen)
+        worker_ai.color = board.turn
+        start = time.perf_counter()
+        move = worker_ai.choose_move(board, move_time=move_time, max_depth=worker_ai.depth if move_time else None)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        result['move'] = move_name(board, move) if move else None
+        result['score'] = worker_ai.best_score
+        result['depth'] = worker_ai.completed_depth
+        result['nodes'] = worker_ai.nodes
+    except Exception as error: # a bad FEN should not end the whole batch
+        return error_result(index, fen, error)
+    return result
+
+# analyses positions (an iterable of FEN strings, read lazily) on a process pool and yields result dicts
+# in the order they finish; at most max_pending positions are queued at once, so the input can be a
+# stream of any length. Each position gets a fixed depth search, or with move_time (seconds) an
+# iterative search up to depth that stops when the time is up. An exception in place of a FEN (a
+# position the input could not give, see pgn_positions) is passed on as an error row.
+def analyse_positions(fens, depth=3, move_time=None, processes=None, max_pending=None, hash_mb=16, backend='board'):
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or processes * 4
+    finished = queue.Queue()
+    with multiprocessing.Pool(processes, initializer=start_worker, initargs=(depth, hash_mb, backend)) as pool:
+        pending = 0
+        for index, fen in enumerate(fens):
+            if isinstance(fen, str):
+                fen = fen.strip()
+                if not fen:
+                    continue
+            if pending >= max_pending:
+                yield take_result(finished)
+                pending -= 1
+            if isinstance(fen, Exception):
+                finished.put(error_result(index, None, fen))
+            else:
+                pool.apply_async(analyse_position, ((index, fen, move_time),), callback=finished.put, error_callback=finished.put)
+            pending += 1
+        while pending:
+            yield take_result(finished)
+            pending -= 1
+
+# the position before every move of each game in lines of PGN; a game ends at a move the board cannot
+# play (en passant, an under-promotion or a bad move), which is given as a ValueError in place of a
+# position, and the games after it are still read
+def pgn_positions(lines):
+    for number, game in enumerate(read_games(lines), 1):
+        try:
+            for fen in game.fens():
+                yield fen
+        except ValueError as error:
+            yield ValueError(f'game {number}: {error}')
+
+def take_result(finished):
+    result = finished.get()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the best move for each FEN in a file (one per line).')
+    parser.add_argument('input', nargs='?', default='-', help='file of FEN strings, - for stdin')
+    parser.add_argument('--pgn', action='store_true', help='the input is PGN, analyse the position before every move')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--move-time', type=float, help='seconds per position (searches iteratively up to --depth)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--hash', type=int, default=16, help='transposition table size per worker in MB')
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    writer = csv.DictWriter(sys.stdout, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    positions = pgn_positions(source) if args.pgn else source
+    with source:
+        for result in analyse_positions(positions, args.depth, args.move_time, args.processes, hash_mb=args.hash):
+            writer.writerow(result)
+            sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
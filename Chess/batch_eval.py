@@ -0,0 +1,146 @@
+import sys
+import time
+import random
+import argparse
+import numpy as np
+from engine import (Board, BitBoard, ChessAI, PIECE_MATERIAL, PIECE_SQUARE_SCORES, KNIGHT_ATTACKS, KING_ATTACKS,
+                    PAWN_ATTACKS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)
+
+# scores many positions in one call with the same terms as ChessAI.evaluate_board with fast_eval (material,
+# piece-square bonuses, king shelter and mobility). A position is 64 piece codes (side * 6 + piece type,
+# square = row * 8 + col) with EMPTY on empty squares, so a batch is an (N, 64) integer array.
+EMPTY = 12
+
+def bitboard_matrix(attacks):
+    return np.array([[bits >> sq & 1 for sq in range(64)] for bits in attacks], dtype=np.float32)
+
+# slider rays in all eight directions are moved together in an (N, 8 * 65) array, one block of 64 squares
+# plus an always zero column per direction; RAY_SOURCES gives each entry the one a step back along its
+# direction (the zero column when that is off the board)
+def step_sources(block, drow, dcol):
+    sources = [(sq // 8 - drow) * 8 + sq % 8 - dcol if 0 <= sq // 8 - drow < 8 and 0 <= sq % 8 - dcol < 8 else 64
+               for sq in range(64)] + [64]
+    return [block * 65 + source for source in sources]
+
+MATERIAL = np.array(PIECE_MATERIAL + [0])
+SQUARE_SCORES = np.array(PIECE_SQUARE_SCORES + [[0] * 64])
+LEAPER_ATTACKS = {KNIGHT: bitboard_matrix(KNIGHT_ATTACKS), KING: bitboard_matrix(KING_ATTACKS)} # piece type -> attacks
+PAWN_ATTACK_MATRICES = [bitboard_matrix(attacks) for attacks in PAWN_ATTACKS]
+RAY_DIRECTIONS = BISHOP_DIRECTIONS + ROOK_DIRECTIONS
+RAY_SOURCES = np.array([index for block, direction in enumerate(RAY_DIRECTIONS) for index in step_sources(block, *direction)])
+SQUARE_FILES = np.array([[sq % 8 == col for col in range(8)] for sq in range(64)], dtype=np.float32)
+KING_FILES = np.array([[abs(sq % 8 - col) <= 1 for col in range(8)] for sq in range(64)]) # files next to a king square
+# squares of the pawns sheltering a king, for white (in front is row - 1) and black
+PAWN_SHIELDS = [np.array([[abs(sq % 8 - shield % 8) <= 1 and shield // 8 == sq // 8 + forward for shield in range(64)]
+                          for sq in range(64)]) for forward in (-1, 1)]
+
+# the 64 piece codes of a Board or BitBoard
+def encode(board):
+    if isinstance(board, BitBoard):
+        return [EMPTY if code is None else code for code in board.squares]
+    return [piece.code if piece else EMPTY for row in board.board for piece in row]
+
+# white's side scores of a batch of encoded positions, as a list of ints; the weights are ChessAI's
+def evaluate_positions(positions, shield_weight=10, open_file_weight=20, mobility_weight=1):
+    codes = np.asarray(positions, dtype=np.intp).reshape(-1, 64)
+    planes = codes[:, None, :] == np.arange(12)[None, :, None] # (N, 12, 64), one plane per piece code
+    scores = MATERIAL[codes].sum(1) + SQUARE_SCORES[codes, np.arange(64)].sum(1)
+    pawnless_files = ((planes[:, PAWN] | planes[:, 6 + PAWN]).astype(np.float32) @ SQUARE_FILES) == 0
+    occupied = codes != EMPTY
+
+    for side, sign in ((0, 1), (1, -1)):
+        own = planes[:, side * 6:side * 6 + 6]
+        king = own[:, KING]
+        king_squares = king.argmax(1)
+        shelter = shield_weight * (PAWN_SHIELDS[side][king_squares] & own[:, PAWN]).sum(1)
+        shelter -= open_file_weight * (KING_FILES[king_squares] & pawnless_files).sum(1)
+        scores += sign * np.where(king.any(1), shelter, 0)
+
+        # number of (piece, attacked square not holding one of our pieces) pairs
+        own = own.astype(np.float32)
+        attacks = own[:, PAWN] @ PAWN_ATTACK_MATRICES[side]
+        for piece_type, matrix in LEAPER_ATTACKS.items():
+            attacks += own[:, piece_type] @ matrix
+        # sliders: every ray moves forward one square at a time, going on past a square only if it is empty
+        # or holds the other king
+        diagonal = np.pad(own[:, BISHOP] + own[:, QUEEN], ((0, 0), (0, 1)))
+        straight = np.pad(own[:, ROOK] + own[:, QUEEN], ((0, 0), (0, 1)))
+        passable = np.tile(np.pad(~occupied | planes[:, (1 - side) * 6 + KING], ((0, 0), (0, 1))), len(RAY_DIRECTIONS))
+        rays = np.concatenate([diagonal] * len(BISHOP_DIRECTIONS) + [straight] * len(ROOK_DIRECTIONS), axis=1)[:, RAY_SOURCES]
+        slider_attacks = rays.copy()
+        for _ in range(6):
+            rays = (rays * passable)[:, RAY_SOURCES]
+            slider_attacks += rays
+        attacks += slider_attacks.reshape(-1, len(RAY_DIRECTIONS), 65)[:, :, :64].sum(1)
+        not_own = own.sum(1) == 0
+        scores += sign * mobility_weight * (attacks * not_own).sum(1).astype(scores.dtype)
+    return scores.tolist()
+
+# the batch_eval extension for ChessAI: scores every child of a depth 1 node in one evaluate_positions call
+class BatchEvaluator:
+    def __init__(self):
+        self.batches = 0
+        self.positions = 0
+
+    def encode(self, board):
+        return encode(board)
+
+    def evaluate(self, positions, shield_weight=10, open_file_weight=20, mobility_weight=1):
+        self.batches += 1
+        self.positions += len(positions)
+        return evaluate_positions(positions, shield_weight, open_file_weight, mobility_weight)
+
+# boards met along random games, for benchmarking
+def random_positions(count, seed):
+    rng = random.Random(seed)
+    boards = []
+    board = Board()
+    while len(boards) < count:
+        moves = board.get_all_moves(board.turn)
+        if not moves or board.piece_count <= 3:
+            board = Board()
+            continue
+        board.make_move(*rng.choice(moves))
+        boards.append(Board.from_fen(board.to_fen()))
+    return boards
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the batch evaluator with ChessAI.evaluate_board.')
+    parser.add_argument('--positions', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=40, help='positions per call, about the children of one node')
+    parser.add_argument('--depth', type=int, default=3, help='depth of the search comparison, 0 to skip it')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    boards = random_positions(args.positions, args.seed)
+    ai = ChessAI('white')
+    start = time.perf_counter()
+    expected = [ai.evaluate_board(board) for board in boards]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    positions = [encode(board) for board in boards]
+    encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    scores = []
+    for first in range(0, len(positions), args.batch):
+        scores += evaluate_positions(positions[first:first + args.batch])
+    batch_seconds = time.perf_counter() - start
+
+    mismatches = sum(1 for score, want in zip(scores, expected) if score != want)
+    print(f'scalar: {len(boards) / scalar_seconds:.0f} positions/s')
+    print(f'batch of {args.batch}: {len(boards) / batch_seconds:.0f} positions/s '
+          f'({len(boards) / (batch_seconds + encode_seconds):.0f} including encoding)')
+    print(f'{mismatches} of {len(boards)} scores differ from evaluate_board')
+
+    if args.depth:
+        for batch_eval in (None, BatchEvaluator()):
+            ai = ChessAI('white', depth=args.depth, quiescence=False, batch_eval=batch_eval)
+            start = time.perf_counter()
+            move = ai.choose_move(Board())
+            print(f'depth {args.depth} search {"with" if batch_eval else "without"} batch evaluation: {move} '
+                  f'score {ai.best_score}, {ai.nodes} nodes in {time.perf_counter() - start:.2f}s')
+    sys.exit(0 if mismatches == 0 else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import statistics
+import subprocess
+import argparse
+
+CHESS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# seconds spent importing module in a fresh interpreter, so nothing is cached from a previous run
+def import_time(module):
+    code = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=CHESS_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.split()[-1])
+
+def bench_import(modules, runs):
+    for module in modules:
+        try:
+            times = [import_time(module) for _ in range(runs)]
+        except RuntimeError as error:
+            print(f'import {module}: failed ({error})')
+            continue
+        print(f'import {module}: best {min(times) * 1000:.1f} ms, median {statistics.median(times) * 1000:.1f} ms over {runs} runs')
+
+# fixed-depth searches of the perft positions with each number of root search workers, timed against the
+# serial search; the scores must not change with the number of workers
+def bench_search(worker_counts, depth):
+    from engine import Board, ChessAI
+    from perft import POSITIONS
+    print(f'{os.cpu_count()} CPUs, depth {depth}, {len(POSITIONS)} positions')
+    baseline = None
+    for workers in worker_counts:
+        ai = ChessAI('white', depth=depth, workers=workers)
+        seconds = 0
+        nodes = 0
+        scores = []
+        for fen, _ in POSITIONS.values():
+            board = Board.from_fen(fen)
+            ai.color = board.turn
+            start = time.perf_counter()
+            ai.choose_move(board)
+            seconds += time.perf_counter() - start
+            nodes += ai.nodes
+            scores.append(ai.best_score)
+        ai.close()
+        if baseline is None:
+            baseline = (seconds, scores)
+        same = 'same scores' if scores == baseline[1] else 'DIFFERENT SCORES'
+        print(f'{workers} workers: {seconds:.2f}s, {nodes} nodes, speed-up {baseline[0] / seconds:.2f}x, {same}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Engine benchmarks.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--modules', nargs='+', default=['engine', 'Chess'], help='modules to time importing')
+    parser.add_argument('--workers', type=int, nargs='+', help='time searches with these numbers of worker processes instead, e.g. 1 2 4 8')
+    parser.add_argument('--depth', type=int, default=4, help='search depth for --workers')
+    args = parser.parse_args()
+    if args.workers:
+        bench_search(args.workers, args.depth)
+    else:
+        bench_import(args.modules, args.runs)
+
+if __name__ == '__main__':
+    main()
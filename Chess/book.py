@@ -0,0 +1,112 @@
+import os
+import sys
+import mmap
+import random
+import struct
+import argparse
+from engine import Board, move_name
+from pgn import read_games
+
+# entries laid out like Polyglot's (big-endian key, move, weight, learn), sorted by key, but keyed on
+# the engine's own Zobrist hash; a move is from square << 6 | to square, with square = row * 8 + col
+ENTRY = struct.Struct('>QHHI')
+
+def encode_move(move):
+    (start_row, start_col), (end_row, end_col) = move
+    return (start_row * 8 + start_col) << 6 | (end_row * 8 + end_col)
+
+def decode_move(code):
+    start, end = code >> 6, code & 63
+    return (start >> 3, start & 7), (end >> 3, end & 7)
+
+# reads a book file through mmap, so only the pages a lookup touches are ever loaded
+class OpeningBook:
+    def __init__(self, path, seed=None):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b'' # an empty file cannot be mapped
+        self.size = len(self.data) // ENTRY.size
+        self.random = random.Random(seed)
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+    def entry(self, index):
+        return ENTRY.unpack_from(self.data, index * ENTRY.size)
+
+    # (move, weight) of every entry for key, found by binary search for the first one
+    def moves(self, key):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.size:
+            entry_key, code, weight, _ = self.entry(low)
+            if entry_key != key:
+                break
+            moves.append((decode_move(code), weight))
+            low += 1
+        return moves
+
+    # a legal book move for the side to move chosen at random in proportion to its weight, or None
+    def pick(self, board):
+        legal = board.get_all_moves(board.turn)
+        moves = [(move, weight) for move, weight in self.moves(board.zobrist_key) if move in legal and weight > 0]
+        if not moves:
+            return None
+        return self.random.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+# counts the moves played in the first max_plies plies of each game and writes them as a book, weighted by
+# how often they were played; games are read one at a time, and a game stops counting at a move it cannot play
+def build_book(games, path, max_plies=20, min_count=1):
+    counts = {}
+    for game in games:
+        try:
+            for ply, (board, move) in enumerate(game.replay()):
+                if ply >= max_plies:
+                    break
+                entry = (board.zobrist_key, encode_move(move))
+                counts[entry] = counts.get(entry, 0) + 1
+        except ValueError:
+            continue
+    entries = sorted((key, code, min(count, 0xFFFF)) for (key, code), count in counts.items() if count >= min_count)
+    with open(path, 'wb') as file:
+        for key, code, weight in entries:
+            file.write(ENTRY.pack(key, code, weight, 0))
+    return len(entries)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or look up an opening book.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='make a book from the opening moves of a PGN file')
+    build.add_argument('pgn')
+    build.add_argument('book')
+    build.add_argument('--plies', type=int, default=20)
+    build.add_argument('--min-count', type=int, default=2, help='leave out moves played fewer times than this')
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('fen', nargs='?', help='defaults to the start position')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open(args.pgn) as file:
+            count = build_book(read_games(file), args.book, args.plies, args.min_count)
+        print(f'{count} entries written to {args.book}')
+    else:
+        book = OpeningBook(args.book)
+        board = Board.from_fen(args.fen) if args.fen else Board()
+        moves = book.moves(board.zobrist_key)
+        total = sum(weight for _, weight in moves)
+        for move, weight in sorted(moves, key=lambda item: -item[1]):
+            print(f'{move_name(board, move)} {weight} ({100 * weight / total:.1f}%)')
+        if not moves:
+            print('position not in book', file=sys.stderr)
+        book.close()
+
+if __name__ == '__main__':
+    main()
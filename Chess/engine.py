@@ -0,0 +1,1750 @@
+import time
+import queue
+import random
+import threading
+import multiprocessing
+from copy import deepcopy
+
+# rules, evaluation and search, kept free of pygame so it can be imported without a display
+ROWS = 8
+COLS = 8
+
+
+# bound types of a transposition table score
+EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+TT_ENTRY_BYTES = 200 # rough CPython size of one stored entry (slot, tuple, key and score)
+
+# fixed number of slots indexed by the low bits of the Zobrist key, each holding
+# (key, depth, score, bound, best move, age) so memory stays within the budget
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        slots = max(1, size_mb * 1024 * 1024 // TT_ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1) # round down to a power of two for masking
+        self.mask = self.size - 1
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+        self.filled = 0
+        self.probes = 0
+        self.hits = 0
+
+    # call once per root search so entries from earlier moves can be replaced first
+    def new_search(self):
+        self.age += 1
+
+    def lookup(self, key):
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    # depth-preferred replacement: a slot written during this search only gives way to an equal or deeper result
+    def store(self, key, depth, score, bound, best_move):
+        index = key & self.mask
+        old = self.entries[index]
+        if old is None:
+            self.filled += 1
+        elif old[5] == self.age and old[1] > depth:
+            return
+        self.entries[index] = (key, depth, score, bound, best_move, self.age)
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def occupancy(self):
+        return self.filled / self.size
+
+MAX_SEARCH_DEPTH = 32
+DELTA_MARGIN = 200 # quiescence skips captures that cannot get within this of alpha/beta even after winning the piece
+MOVES_TO_GO = 30 # the clock is shared out as if this many moves were left
+TABLEBASE_PIECES = 3 # positions with at most this many pieces (kings included) are looked up in the endgame tables
+
+class ChessAI:
+    # backend is 'board' (search on Board itself) or 'bitboard' (search on a BitBoard copy of it)
+    # the transposition table lives as long as the AI, so it carries over between moves of a game
+    # move_ordering=False searches moves in board-scan order, for comparing node counts
+    # quiescence=False scores depth 0 with evaluate_board alone instead of resolving captures first
+    # fast_eval=False counts legal moves and fully empty files instead of pseudo-legal moves and pawnless files
+    # book is an opening book (see book.OpeningBook) asked for a move before searching
+    # tablebase (see tablebase.Tablebase) scores positions with at most TABLEBASE_PIECES pieces, at the root and in the search
+    # batch_eval (see batch_eval.BatchEvaluator) scores all children of a depth 1 node in one call; it gives the
+    # fast_eval scores, so it is only used with fast_eval and without quiescence
+    # shield_weight (per pawn in front of the king), open_file_weight (per open file next to it) and mobility_weight
+    # (per attacked square, or per legal move without fast_eval) weigh the evaluation terms beside material
+    # workers > 1 splits the root moves over that many processes (see search_root_parallel), each with its own
+    # hash_mb transposition table; call close() to shut them down
+    def __init__(self, color, depth=3, backend='board', hash_mb=16, move_ordering=True, quiescence=True, fast_eval=True,
+                 book=None, tablebase=None, batch_eval=None, workers=1, shield_weight=10, open_file_weight=20,
+                 mobility_weight=1):
+        self.color = color
+        self.shield_weight = shield_weight
+        self.open_file_weight = open_file_weight
+        self.mobility_weight = mobility_weight
+        self.workers = workers
+        self.pool = None
+        self.searches = 0 # root searches sent to the workers, so they know when to reset their heuristics
+        self.worker_pv = None # (move, principal variation) reported by the worker that searched the best move
+        self.batch_eval = batch_eval
+        self.book = book
+        self.tablebase = tablebase
+        self.depth = depth
+        self.backend = backend
+        self.tt = TranspositionTable(hash_mb)
+        self.move_ordering = move_ordering
+        self.use_quiescence = quiescence
+        self.fast_eval = fast_eval
+        self.killers = [[None, None] for _ in range(MAX_SEARCH_DEPTH + 1)] # two quiet cutoff moves per ply
+        self.history = {} # quiet move -> how often (weighted by depth) it caused a cutoff
+        self.nodes = 0
+        self.deadline = None
+        self.stopped = False
+        self.completed_depth = 0
+        self.best_score = None # white's side score of the last move chosen
+        self.on_iteration = None # called as on_iteration(board, depth, score, seconds, pv) after each finished iteration
+
+    # with a finite time_left (seconds on the AI's clock) or a move_time this deepens one ply at a time
+    # (up to max_depth) until the time is spent, otherwise it searches to the fixed depth
+    def choose_move(self, board, time_left=float('inf'), increment=0, move_time=None, max_depth=None):
+        if self.book:
+            move = self.book.pick(board)
+            if move:
+                self.nodes = self.completed_depth = 0
+                self.best_score = None
+                return move
+        if self.tablebase and board.piece_count <= TABLEBASE_PIECES:
+            move = self.tablebase.best_move(board)
+            if move:
+                self.nodes = self.completed_depth = 0
+                self.best_score = self.tablebase.probe(board)
+                return move
+        if self.backend == 'bitboard' and not isinstance(board, BitBoard):
+            board = BitBoard.from_board(board, self.color)
+        self.tt.new_search()
+        self.new_search_heuristics()
+        self.nodes = 0
+        self.stopped = False
+        if time_left == float('inf') and move_time is None:
+            self.deadline = None
+            self.completed_depth = self.depth
+            move, self.best_score = self.search_root(board, self.depth)
+            return move
+
+        start_time = time.time()
+        budget = move_time if move_time is not None else self.allocate_time(time_left, increment)
+        self.deadline = start_time + budget
+        best_move = None
+        self.completed_depth = 0
+        self.best_score = None
+        for depth in range(1, (max_depth or MAX_SEARCH_DEPTH) + 1):
+            move, score = self.search_root(board, depth, best_move)
+            if self.stopped: # an unfinished iteration is thrown away, unless there is nothing better
+                if best_move is None:
+                    best_move = move # the best of the depth 1 moves searched in time, else the first in order
+                break
+            best_move = move
+            self.best_score = score
+            self.completed_depth = depth
+            if self.on_iteration:
+                self.on_iteration(board, depth, score, time.time() - start_time, self.principal_variation(board, move, depth))
+            # stop on a forced mate, or when the next (longer) iteration is unlikely to finish on the clock
+            if score in (float('inf'), float('-inf')) or (move_time is None and time.time() - start_time > budget / 2):
+                break
+        self.deadline = None
+        return best_move
+
+    # asks a running search to give up as soon as possible, safe to call from another thread
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    # move followed by the best replies stored in the transposition table, as long as they stay legal
+    def principal_variation(self, board, move, max_length):
+        if self.worker_pv and self.worker_pv[0] == move:
+            return self.worker_pv[1][:max_length]
+        pv = []
+        undos = []
+        seen = set()
+        while move and len(pv) < max_length and board.zobrist_key not in seen and move in board.get_all_moves(board.turn):
+            seen.add(board.zobrist_key)
+            pv.append(move)
+            undos.append(board.make_move(*move))
+            entry = self.tt.lookup(board.zobrist_key)
+            move = entry[4] if entry else None
+        for undo in reversed(undos):
+            board.unmake_move(undo)
+        return pv
+
+    def allocate_time(self, time_left, increment):
+        budget = time_left / MOVES_TO_GO + increment * 0.8
+        return max(0.01, min(budget, time_left / 2))
+
+    # returns (best move, score); first_move (the previous iteration's best) is searched first
+    def search_root(self, board, depth, first_move=None):
+        moves = self.get_all_moves(board, self.color)
+        if self.move_ordering:
+            entry = self.tt.lookup(board.zobrist_key)
+            moves = self.order_moves(board, moves, 0, first_move or (entry[4] if entry else None))
+        elif first_move in moves:
+            moves.remove(first_move)
+            moves.insert(0, first_move)
+        self.worker_pv = None
+        if self.workers > 1 and len(moves) > 1:
+            return self.search_root_parallel(board, moves, depth)
+        return self.search_moves(board, moves, depth)
+
+    # alpha-beta over root moves in order, returning the best move and its score
+    def search_moves(self, board, moves, depth):
+        best_move = moves[0] if moves else None
+        best_score = float('-inf') if self.color == 'white' else float('inf')
+        alpha = float('-inf')
+        beta = float('inf')
+
+        for move in moves:
+            undo = board.make_move(*move)
+            score = self.minimax(board, depth - 1, alpha, beta, self.color != 'white')
+            board.unmake_move(undo)
+            if self.stopped:
+                break
+
+            if self.color == 'white':
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                alpha = max(alpha, best_score)
+            else:
+                if score < best_score:
+                    best_score = score
+                    best_move = move
+                beta = min(beta, best_score)
+
+            if beta <= alpha:
+                break
+
+        return best_move, best_score
+
+    # young brothers wait: the first (most likely best) move is searched here with a full window, then the
+    # others go out to the worker processes one at a time, each with the best score found so far as its
+    # bound. Only the side to move's bound is set, so a score that beats it is exact and any other score
+    # just shows the move is no better; of two exact scores that tie the earlier move is kept, as in search_moves.
+    def search_root_parallel(self, board, moves, depth):
+        best_move, best_score = self.search_moves(board, moves[:1], depth)
+        if self.stopped:
+            return best_move, best_score
+        if self.pool is None: # spawned, not forked: the search usually runs on a thread, and forking then can deadlock
+            settings = (self.backend, self.tt.size_mb, self.move_ordering, self.use_quiescence, self.fast_eval,
+                        self.tablebase, self.batch_eval, self.shield_weight, self.open_file_weight, self.mobility_weight)
+            self.pool = multiprocessing.get_context('spawn').Pool(self.workers, initializer=start_search_worker, initargs=settings)
+        self.searches += 1
+        white = self.color == 'white'
+        best_index = 0
+        finished = queue.Queue()
+        waiting = list(enumerate(moves))[1:]
+        bounds = {} # move index -> the best score when it was sent out
+        running = 0
+        while waiting or running:
+            if self.stopped: # by the deadline or from outside, past the deadline or not: nothing more is sent out
+                waiting = []
+                if not running:
+                    break
+            while waiting and running < self.workers:
+                index, move = waiting.pop(0)
+                bounds[index] = best_score
+                alpha, beta = (best_score, float('inf')) if white else (float('-inf'), best_score)
+                job = (self.searches, board, move, depth, alpha, beta, self.deadline, index)
+                self.pool.apply_async(search_worker_move, (job,), callback=finished.put, error_callback=finished.put)
+                running += 1
+            try:
+                result = finished.get(timeout=0.05)
+            except queue.Empty:
+                if self.stopped and not (self.deadline and time.time() >= self.deadline):
+                    self.close() # stopped from outside: the workers cannot be told, so they are ended
+                    break
+                continue
+            running -= 1
+            if isinstance(result, BaseException):
+                self.close()
+                raise result
+            index, score, nodes, stopped, pv = result
+            self.nodes += nodes
+            if stopped:
+                self.stopped = True # out of time; wait for the other workers, which stop at the same deadline
+                continue
+            exact = score > bounds[index] if white else score < bounds[index]
+            if exact and ((score > best_score if white else score < best_score) or (score == best_score and index < best_index)):
+                best_move, best_score, best_index = moves[index], score, index
+                self.worker_pv = (best_move, pv)
+        return best_move, best_score
+    
+    def minimax(self, board, depth, alpha, beta, maximizing_player, ply=1):
+        if self.deadline and time.time() >= self.deadline:
+            self.stopped = True
+        if self.stopped:
+            return 0
+        self.nodes += 1
+        if self.tablebase and board.piece_count <= TABLEBASE_PIECES:
+            score = self.tablebase.probe(board)
+            if score is not None:
+                return score
+
+        key = board.zobrist_key
+        entry = self.tt.lookup(key)
+        if entry and entry[1] >= depth:
+            score, bound = entry[2], entry[3]
+            if bound == EXACT:
+                return score
+            if bound == LOWER_BOUND:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if beta <= alpha:
+                return score
+
+        if depth == 0:
+            if self.use_quiescence:
+                return self.quiescence(board, alpha, beta, maximizing_player)
+            score = self.evaluate_board(board)
+            self.tt.store(key, 0, score, EXACT, None)
+            return score
+
+        original_alpha, original_beta = alpha, beta
+        best_move = None
+        moves = self.get_all_moves(board, 'white' if maximizing_player else 'black')
+        if self.move_ordering:
+            moves = self.order_moves(board, moves, ply, entry[4] if entry else None)
+        child_scores = None
+        if depth == 1 and self.batch_eval and self.fast_eval and not self.use_quiescence:
+            child_scores = self.evaluate_children(board, moves)
+        if maximizing_player:
+            max_eval = float('-inf')
+            for index, move in enumerate(moves):
+                if child_scores:
+                    eval = child_scores[index]
+                else:
+                    undo = board.make_move(*move)
+                    eval = self.minimax(board, depth - 1, alpha, beta, False, ply + 1)
+                    board.unmake_move(undo)
+                if self.stopped:
+                    return 0
+                if eval > max_eval:
+                    max_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    self.record_cutoff(board, move, depth, ply)
+                    break
+            best_eval = max_eval
+        else:
+            min_eval = float('inf')
+            for index, move in enumerate(moves):
+                if child_scores:
+                    eval = child_scores[index]
+                else:
+                    undo = board.make_move(*move)
+                    eval = self.minimax(board, depth - 1, alpha, beta, True, ply + 1)
+                    board.unmake_move(undo)
+                if self.stopped:
+                    return 0
+                if eval < min_eval:
+                    min_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    self.record_cutoff(board, move, depth, ply)
+                    break
+            best_eval = min_eval
+
+        # a score outside the window is only a bound on the true value
+        if best_eval <= original_alpha:
+            bound = UPPER_BOUND
+        elif best_eval >= original_beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, best_eval, bound, best_move)
+        return best_eval
+
+    # the depth 0 scores of each move's position, evaluated together by batch_eval (tablebase positions are
+    # looked up as minimax would)
+    def evaluate_children(self, board, moves):
+        positions = []
+        probed = {}
+        for index, move in enumerate(moves):
+            undo = board.make_move(*move)
+            if self.tablebase and board.piece_count <= TABLEBASE_PIECES:
+                score = self.tablebase.probe(board)
+                if score is not None:
+                    probed[index] = score
+            positions.append(self.batch_eval.encode(board))
+            board.unmake_move(undo)
+        self.nodes += len(moves)
+        weights = (self.shield_weight, self.open_file_weight, self.mobility_weight)
+        scores = self.batch_eval.evaluate(positions, *weights) if positions else []
+        for index, score in probed.items():
+            scores[index] = score
+        return scores
+
+    # searches captures only until the position is quiet, so depth 0 never stops in the middle of an
+    # exchange; the side to move may also stand pat on the static evaluation instead of capturing
+    def quiescence(self, board, alpha, beta, maximizing_player):
+        if self.deadline and time.time() >= self.deadline:
+            self.stopped = True
+        if self.stopped:
+            return 0
+        self.nodes += 1
+
+        stand_pat = self.evaluate_board(board)
+        if maximizing_player:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+
+        best_eval = stand_pat
+        color = 'white' if maximizing_player else 'black'
+        captures = [move for move in self.get_all_moves(board, color) if board.piece_class_at(*move[1])]
+        for move in self.order_moves(board, captures, None, None):
+            gain = PIECE_VALUES[board.piece_class_at(*move[1])] + DELTA_MARGIN
+            if (stand_pat + gain <= alpha) if maximizing_player else (stand_pat - gain >= beta): # delta pruning
+                continue
+            undo = board.make_move(*move)
+            eval = self.quiescence(board, alpha, beta, not maximizing_player)
+            board.unmake_move(undo)
+            if self.stopped:
+                return 0
+            if maximizing_player:
+                best_eval = max(best_eval, eval)
+                alpha = max(alpha, eval)
+            else:
+                best_eval = min(best_eval, eval)
+                beta = min(beta, eval)
+            if beta <= alpha:
+                break
+        return best_eval
+
+    def get_all_moves(self, board, color):
+        return board.get_all_moves(color)
+
+    # hash move, then captures by most valuable victim / least valuable attacker,
+    # then this ply's killer moves (none when ply is None), then quiet moves by history score
+    def order_moves(self, board, moves, ply, hash_move):
+        killers = self.killers[ply] if ply is not None and ply < len(self.killers) else (None, None)
+        history = self.history
+
+        def move_score(move):
+            if move == hash_move:
+                return 1 << 30
+            start, end = move
+            victim = board.piece_class_at(*end)
+            if victim:
+                return (1 << 26) + PIECE_VALUES[victim] * 10 - PIECE_VALUES[board.piece_class_at(*start)]
+            if move == killers[0] or move == killers[1]:
+                return 1 << 25
+            return history.get(move, 0)
+
+        return sorted(moves, key=move_score, reverse=True)
+
+    # a quiet move that caused a beta cutoff becomes a killer for its ply and gains history
+    def record_cutoff(self, board, move, depth, ply):
+        if board.piece_class_at(*move[1]) or ply >= len(self.killers):
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move] = min(self.history.get(move, 0) + depth * depth, (1 << 25) - 1)
+
+    # killers only make sense for one search, history is kept but aged
+    def new_search_heuristics(self):
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+        for move in self.history:
+            self.history[move] //= 2
+
+    def effective_branching_factor(self):
+        if not self.completed_depth or not self.nodes:
+            return 0.0
+        return self.nodes ** (1 / self.completed_depth)
+
+    def evaluate_board(self, board):
+        if DEBUG_INCREMENTAL_EVAL:
+            assert (board.material, board.piece_square) == board.compute_static_scores(), 'incremental evaluation out of sync'
+        if isinstance(board, BitBoard):
+            return self.evaluate_bitboard(board)
+        # material and piece-square bonuses are kept up to date by the board as moves are made
+        score = board.material + board.piece_square
+        if self.fast_eval:
+            score += self.evaluate_king_shelter(board, 'white') - self.evaluate_king_shelter(board, 'black')
+            score += (board.mobility('white') - board.mobility('black')) * self.mobility_weight
+            return score
+
+        # Consider king safety
+        white_king_safety = self.evaluate_king_safety(board, 'white')
+        black_king_safety = self.evaluate_king_safety(board, 'black')
+        score += white_king_safety - black_king_safety
+
+        # Consider board control
+        white_control = self.evaluate_board_control(board, 'white')
+        black_control = self.evaluate_board_control(board, 'black')
+        score += (white_control - black_control) * self.mobility_weight
+
+        return score
+
+    def evaluate_king_safety(self, board, color):
+        king_position = None
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if isinstance(piece, King) and piece.color == color:
+                    king_position = (row, col)
+                    break
+            if king_position:
+                break
+
+        if not king_position:
+            return 0
+
+        safety_score = 0
+        row, col = king_position
+
+        # Check pawns in front of the king
+        pawn_shield = 0
+        pawn_row = row - 1 if color == 'white' else row + 1
+        for c in range(max(0, col - 1), min(8, col + 2)):
+            if 0 <= pawn_row < 8:
+                piece = board.board[pawn_row][c]
+                if isinstance(piece, Pawn) and piece.color == color:
+                    pawn_shield += 1
+        safety_score += pawn_shield * self.shield_weight
+
+        # Penalize open files near the king
+        for c in range(max(0, col - 1), min(8, col + 2)):
+            file_open = True
+            for r in range(8):
+                if board.board[r][c] is not None:
+                    file_open = False
+                    break
+            if file_open:
+                safety_score -= self.open_file_weight
+
+        return safety_score
+
+    # evaluate_king_safety from the tracked king square and per-file pawn counts, treating a file
+    # with no pawns as open
+    def evaluate_king_shelter(self, board, color):
+        king_position = board.king_positions[color]
+        if not king_position:
+            return 0
+
+        safety_score = 0
+        row, col = king_position
+        pawn_row = row - 1 if color == 'white' else row + 1
+        side = BITBOARD_COLORS.index(color)
+        pawn_files = board.pawn_files
+        for c in range(max(0, col - 1), min(8, col + 2)):
+            if 0 <= pawn_row < 8:
+                piece = board.board[pawn_row][c]
+                if isinstance(piece, Pawn) and piece.side == side:
+                    safety_score += self.shield_weight
+            if not pawn_files['white'][c] and not pawn_files['black'][c]:
+                safety_score -= self.open_file_weight
+        return safety_score
+
+    def evaluate_board_control(self, board, color):
+        control_score = 0
+        side = BITBOARD_COLORS.index(color)
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if piece and piece.side == side:
+                    control_score += len(board.get_valid_moves(piece))
+        return control_score
+
+    # same terms as evaluate_board, read straight from the bitboards
+    def evaluate_bitboard(self, board):
+        score = board.material + board.piece_square
+        pieces = board.pieces
+        if self.fast_eval:
+            occupied = pieces[PAWN] | pieces[6 + PAWN] # only pawns close a file
+        else:
+            occupied = board.occupied[0] | board.occupied[1]
+        for side in range(2):
+            king = pieces[side * 6 + KING]
+            if not king:
+                continue
+            row, col = divmod(king.bit_length() - 1, 8)
+            pawn_row = row - 1 if side == 0 else row + 1
+            safety_score = 0
+            for c in range(max(0, col - 1), min(8, col + 2)):
+                if 0 <= pawn_row < 8 and pieces[side * 6 + PAWN] & (1 << (pawn_row * 8 + c)):
+                    safety_score += self.shield_weight
+                if not occupied & FILE_MASKS[c]:
+                    safety_score -= self.open_file_weight
+            score += safety_score if side == 0 else -safety_score
+
+        if self.fast_eval:
+            score += (board.mobility('white') - board.mobility('black')) * self.mobility_weight
+        else:
+            score += (len(board.legal_moves('white')) - len(board.legal_moves('black'))) * self.mobility_weight
+        return score
+        
+search_ai = None # the worker process's engine, kept (transposition table included) between jobs
+
+def start_search_worker(backend, hash_mb, move_ordering, quiescence, fast_eval, tablebase, batch_eval, shield_weight,
+                        open_file_weight, mobility_weight):
+    global search_ai
+    search_ai = ChessAI('white', backend=backend, hash_mb=hash_mb, move_ordering=move_ordering, quiescence=quiescence,
+                        fast_eval=fast_eval, tablebase=tablebase, batch_eval=batch_eval, shield_weight=shield_weight,
+                        open_file_weight=open_file_weight, mobility_weight=mobility_weight)
+
+# one root move of ChessAI.search_root_parallel, searched in a worker process within (alpha, beta)
+def search_worker_move(job):
+    search, board, move, depth, alpha, beta, deadline, index = job
+    ai = search_ai
+    if ai.searches != search:
+        ai.searches = search
+        ai.tt.new_search()
+        ai.new_search_heuristics()
+    ai.color = board.turn
+    ai.nodes = 0
+    ai.deadline = deadline
+    ai.stopped = False
+    undo = board.make_move(*move)
+    score = ai.minimax(board, depth - 1, alpha, beta, board.turn == 'white')
+    board.unmake_move(undo)
+    pv = ai.principal_variation(board, move, depth) if not ai.stopped else []
+    return index, score, ai.nodes, ai.stopped, pv
+
+# node counts of the same fixed-depth search with and without move ordering
+def measure_move_ordering(board, color, depth, backend='board'):
+    results = {}
+    for ordering in (False, True):
+        ai = ChessAI(color, depth, backend, move_ordering=ordering)
+        ai.choose_move(board)
+        results['on' if ordering else 'off'] = (ai.nodes, ai.effective_branching_factor())
+    return results
+
+# runs ChessAI.choose_move in a background thread on a snapshot of the board, so the
+# game loop can keep drawing and handling events and just poll for the move
+class AIWorker:
+    def __init__(self, ai):
+        self.ai = ai
+        self.thread = None
+        self.result = None
+        self.finished = False
+
+    def start(self, board, time_left=float('inf'), increment=0):
+        snapshot = deepcopy(board)
+        self.result = None
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, args=(snapshot, time_left, increment), daemon=True)
+        self.thread.start()
+
+    def run(self, board, time_left, increment):
+        self.result = self.ai.choose_move(board, time_left, increment)
+        self.finished = True
+
+    def busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # returns (True, move) once the search has finished, (False, None) while it is still running or idle
+    def poll(self):
+        if self.finished:
+            self.finished = False
+            self.thread = None
+            return True, self.result
+        return False, None
+
+    def cancel(self):
+        while self.busy():
+            self.ai.stop() # repeated in case the search had not started when first asked
+            self.thread.join(0.05)
+        self.thread = None
+        self.finished = False
+        self.result = None
+
+# pieces have __slots__ so they carry no __dict__, which keeps them small and quick to copy; code is
+# the piece's index into the Zobrist and score tables (and its BitBoard code), side * 6 + piece type;
+# side (0 white, 1 black) is what move generation compares, an int compare being cheaper than a string one
+class Piece:
+    __slots__ = ('color', 'position', 'has_moved', 'code', 'side')
+
+    def __init__(self, color, position):
+        self.color = color
+        self.position = position
+        self.has_moved = False
+        self.code = PIECE_CODES[color, type(self)]
+        self.side = self.code // 6
+
+    # every field is immutable, so a copy is just the five values (quicker than copy's generic slots path)
+    def __deepcopy__(self, memo):
+        piece = object.__new__(type(self))
+        piece.color, piece.position, piece.has_moved, piece.code, piece.side = (self.color, self.position, self.has_moved,
+                                                                             self.code, self.side)
+        memo[id(self)] = piece
+        return piece
+
+    def valid_moves(self, board):
+        raise NotImplementedError
+    
+    def move(self, new_position):
+        self.position = new_position
+        self.has_moved = True
+
+class Pawn(Piece):
+    __slots__ = ()
+
+    def valid_moves(self, board):
+        row, col = self.position
+        moves = []
+        direction = -1 if self.side == 0 else 1
+        # move forward
+        if 0 <= row + direction < 8 and board[row + direction][col] is None:
+            moves.append((row + direction, col))
+            # initial double move
+            if row == (6 if self.side == 0 else 1):
+                if board[row + 2*direction][col] is None:
+                    moves.append((row+2*direction, col))
+        
+        # diagonal capture
+        for dcol in [-1,1]:
+            if 0 <= row + direction < 8 and 0 <= col + dcol < 8:
+                if board[row+direction][col+dcol] is not None and board[row + direction][col + dcol].side != self.side:
+                    moves.append((row + direction, col + dcol))
+
+        return moves
+
+    # queen me
+    def move(self, new_position):
+        super().move(new_position)
+        # check is pawn has reached the opposited side
+        if (self.color == 'white' and self.position[0] == 0) or (self.color == 'black' and self.position[0] == 7):
+            return Queen(self.color, self.position)
+        return self
+
+class Rook(Piece):
+    __slots__ = ()
+
+    def valid_moves(self, board):
+        moves = []
+        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+        for direction in directions:
+            for i in range(1, 8):
+                row = self.position[0] + direction[0] * i
+                col = self.position[1] + direction[1] * i
+                if 0 <= row < 8 and 0 <= col < 8:
+                    if board[row][col] is None:
+                        moves.append((row, col))
+                    elif board[row][col].side != self.side:
+                        moves.append((row, col))
+                        break
+                    else:
+                        break
+                else:
+                    break
+        return moves
+    
+class Knight(Piece):
+    __slots__ = ()
+
+    def valid_moves(self, board):
+        moves = [] # create a list that will serve as available moves
+        knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)] # all possible moves for knight
+        for move in knight_moves: # check to see where the move will go in relation to current position
+            row = self.position[0] + move[0]
+            col = self.position[1] + move[1]
+            if 0 <= row < 8 and 0 <= col < 8: # if the position is on the game board
+                if board[row][col] is None or board[row][col].side != self.side: # and if the position isnt already occupied by a friendly piece
+                    moves.append((row, col))
+        return moves
+    
+class Bishop(Piece):
+    __slots__ = ()
+
+    def valid_moves(self, board):
+        moves = []
+        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+        for direction in directions:
+            for i in range(1, 8):
+                row = self.position[0] + direction[0] * i
+                col = self.position[1] + direction[1] * i
+                if 0 <= row < 8 and 0 <= col < 8:
+                    if board[row][col] is None:
+                        moves.append((row, col))
+                    elif board[row][col].side != self.side:
+                        moves.append((row, col))
+                        break
+                    else:
+                        break
+                else:
+                    break
+        return moves
+    
+class Queen(Piece):
+    __slots__ = ()
+
+    def valid_moves(self, board):
+        moves = []
+        directions = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+        for direction in directions:
+            for i in range(1, 8):
+                row = self.position[0] + direction[0] * i
+                col = self.position[1] + direction[1] * i
+                if 0 <= row < 8 and 0 <= col < 8:
+                    if board[row][col] is None:
+                        moves.append((row, col))
+                    else: # the square is occupied
+                        if board[row][col].side != self.side:
+                            moves.append((row, col))
+                        break # stop checking after encountering any piece
+                else:
+                    break # stop if were off board
+        return moves
+
+    
+class King(Piece):
+    __slots__ = ()
+
+    def __init__(self, color, position):
+        super().__init__(color, position)
+        self.has_moved = False
+
+    def move(self, new_position):
+        self.has_moved = True
+        self.position = new_position
+        return self
+
+    def valid_moves(self, board):
+        moves = []
+        directions = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+        for direction in directions:
+            row = self.position[0] + direction[0] 
+            col = self.position[1] + direction[1]
+            if 0 <= row < 8 and 0 <= col < 8:
+                if board[row][col] is None or board[row][col].side != self.side:
+                    moves.append((row, col))
+        
+        return moves
+
+    # Castling
+    def get_castling_moves(self, board):
+        castling_moves = []
+        if self.has_moved:
+            return castling_moves
+    
+        row = self.position[0]
+        # Kingside
+        if isinstance(board[row][7], Rook) and not board[row][7].has_moved:
+            if all(board[row][col] is None for col in range(5, 7)):
+                castling_moves.append((row, 6))
+        # Queenside
+        if isinstance(board[row][0], Rook) and not board[row][0].has_moved:
+            if all(board[row][col] is None for col in range(1, 4)):
+                castling_moves.append((row, 2))
+
+        return castling_moves
+    
+PIECE_VALUES = {
+    Pawn: 100,
+    Knight: 320,
+    Bishop: 330,
+    Rook: 500,
+    Queen: 900,
+    King: 20000
+}
+POSITION_BONUSES = {
+    Pawn: [
+        [0,  0,  0,  0,  0,  0,  0,  0],
+        [50, 50, 50, 50, 50, 50, 50, 50],
+        [10, 10, 20, 30, 30, 20, 10, 10],
+        [5,  5, 10, 25, 25, 10,  5,  5],
+        [0,  0,  0, 20, 20,  0,  0,  0],
+        [5, -5,-10,  0,  0,-10, -5,  5],
+        [5, 10, 10,-20,-20, 10, 10,  5],
+        [0,  0,  0,  0,  0,  0,  0,  0]
+    ],
+    Knight: [
+        [-50,-40,-30,-30,-30,-30,-40,-50],
+        [-40,-20,  0,  0,  0,  0,-20,-40],
+        [-30,  0, 10, 15, 15, 10,  0,-30],
+        [-30,  5, 15, 20, 20, 15,  5,-30],
+        [-30,  0, 15, 20, 20, 15,  0,-30],
+        [-30,  5, 10, 15, 15, 10,  5,-30],
+        [-40,-20,  0,  5,  5,  0,-20,-40],
+        [-50,-40,-30,-30,-30,-30,-40,-50]
+    ],
+    Bishop: [
+        [-20,-10,-10,-10,-10,-10,-10,-20],
+        [-10,  0,  0,  0,  0,  0,  0,-10],
+        [-10,  0,  5, 10, 10,  5,  0,-10],
+        [-10,  5,  5, 10, 10,  5,  5,-10],
+        [-10,  0, 10, 10, 10, 10,  0,-10],
+        [-10, 10, 10, 10, 10, 10, 10,-10],
+        [-10,  5,  0,  0,  0,  0,  5,-10],
+        [-20,-10,-10,-10,-10,-10,-10,-20]
+    ],
+    Rook: [
+        [0,  0,  0,  0,  0,  0,  0,  0],
+        [5, 10, 10, 10, 10, 10, 10,  5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [0,  0,  0,  5,  5,  0,  0,  0]
+    ],
+    Queen: [
+        [-20,-10,-10, -5, -5,-10,-10,-20],
+        [-10,  0,  0,  0,  0,  0,  0,-10],
+        [-10,  0,  5,  5,  5,  5,  0,-10],
+        [-5,  0,  5,  5,  5,  5,  0, -5],
+        [0,  0,  5,  5,  5,  5,  0, -5],
+        [-10,  5,  5,  5,  5,  5,  0,-10],
+        [-10,  0,  5,  0,  0,  0,  0,-10],
+        [-20,-10,-10, -5, -5,-10,-10,-20]
+    ],
+    King: [
+        [-30,-40,-40,-50,-50,-40,-40,-30],
+        [-30,-40,-40,-50,-50,-40,-40,-30],
+        [-30,-40,-40,-50,-50,-40,-40,-30],
+        [-30,-40,-40,-50,-50,-40,-40,-30],
+        [-20,-30,-30,-40,-40,-30,-30,-20],
+        [-10,-20,-20,-20,-20,-20,-20,-10],
+        [20, 20,  0,  0,  0,  0, 20, 20],
+        [20, 30, 10,  0,  0, 10, 30, 20]
+    ]
+}
+
+# piece codes (color * 6 + piece type) shared by the Zobrist keys and the bitboard backend
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+BITBOARD_PIECES = [Pawn, Knight, Bishop, Rook, Queen, King] # piece class for each piece type
+BITBOARD_COLORS = ['white', 'black']
+FEN_LETTERS = 'pnbrqk' # lower case letter of each piece type, white pieces are upper case
+
+PIECE_CODES = {(color, piece_class): side * 6 + piece_type
+               for side, color in enumerate(BITBOARD_COLORS) for piece_type, piece_class in enumerate(BITBOARD_PIECES)}
+
+def square_name(square):
+    row, col = square
+    return 'abcdefgh'[col] + str(8 - row)
+
+def parse_square(name):
+    return 8 - int(name[1]), 'abcdefgh'.index(name[0])
+
+# coordinate notation (e2e4, e7e8q) for a move on board (a Board or BitBoard)
+def move_name(board, move):
+    start, end = move
+    name = square_name(start) + square_name(end)
+    if board.piece_class_at(*start) is Pawn and end[0] in (0, 7):
+        name += 'q' # pawns always promote to a queen
+    return name
+
+# castling rights: bit 0/1 white kingside/queenside, bit 2/3 black kingside/queenside
+CASTLING_MASKS = [15] * 64 # rights kept when a move starts or ends on a square
+CASTLING_MASKS[60] = 15 & ~3 # e1
+CASTLING_MASKS[63] = 15 & ~1 # h1
+CASTLING_MASKS[56] = 15 & ~2 # a1
+CASTLING_MASKS[4] = 15 & ~12 # e8
+CASTLING_MASKS[7] = 15 & ~4 # h8
+CASTLING_MASKS[0] = 15 & ~8 # a8
+
+# Zobrist keys: a position's key is the XOR of a random number per (piece, square), one per set of
+# castling rights and one for black to move, so a move only has to XOR the parts it changes
+zobrist_random = random.Random(20240601)
+ZOBRIST_PIECES = [[zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+
+# signed (white positive) material and piece-square score of each piece code, kept as running totals
+# by the boards; POSITION_BONUSES are written from white's side, so black reads them mirrored
+PIECE_MATERIAL = [PIECE_VALUES[piece_class] * sign for sign in (1, -1) for piece_class in BITBOARD_PIECES]
+PIECE_SQUARE_SCORES = [[POSITION_BONUSES[piece_class][sq >> 3 if sign == 1 else 7 - (sq >> 3)][sq & 7] * sign for sq in range(64)]
+                       for sign in (1, -1) for piece_class in BITBOARD_PIECES]
+DEBUG_INCREMENTAL_EVAL = False # check the running totals against a full recomputation on every evaluation
+
+KNIGHT_STEPS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_STEPS = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+SLIDER_DIRECTIONS = {Rook: KING_STEPS[:4], Bishop: KING_STEPS[4:], Queen: KING_STEPS}
+
+class Board:
+    def __init__(self):
+        self.board = self.create_board()
+        self.setup_pieces()
+        self.turn = 'white'
+        self.castling = self.castling_rights()
+        self.zobrist_key = self.compute_zobrist_key()
+        self.material, self.piece_square = self.compute_static_scores()
+        self.find_kings_and_pawns()
+        self.constraints_cache = (None, None)
+        self.attack_maps_key = None
+        self.attack_maps = {}
+        self.legal_moves_key = None
+        self.legal_moves = {}
+
+    # builds a position from the placement, side to move and castling fields of a FEN string
+    # (the board has no en passant, so that field is ignored); raises ValueError if the placement is not 8x8
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        ranks = fields[0].split('/') if fields else []
+        if len(ranks) != 8:
+            raise ValueError(f'invalid FEN {fen!r}')
+        board = cls()
+        board.board = board.create_board()
+        for row, rank in enumerate(ranks):
+            col = 0
+            for letter in rank:
+                if letter.isdigit():
+                    col += int(letter)
+                    continue
+                if letter.lower() not in FEN_LETTERS or col >= 8:
+                    raise ValueError(f'invalid FEN {fen!r}')
+                piece = BITBOARD_PIECES[FEN_LETTERS.index(letter.lower())]('white' if letter.isupper() else 'black', (row, col))
+                piece.has_moved = isinstance(piece, (King, Rook)) # castling rights below clear it again
+                board.board[row][col] = piece
+                col += 1
+            if col != 8:
+                raise ValueError(f'invalid FEN {fen!r}')
+
+        board.turn = 'black' if len(fields) > 1 and fields[1] == 'b' else 'white'
+        rights = fields[2] if len(fields) > 2 else '-'
+        for letter, (row, rook_col) in zip('KQkq', [(7, 7), (7, 0), (0, 7), (0, 0)]):
+            if letter in rights:
+                for piece in (board.board[row][4], board.board[row][rook_col]):
+                    if piece:
+                        piece.has_moved = False
+
+        board.castling = board.castling_rights()
+        board.zobrist_key = board.compute_zobrist_key()
+        board.material, board.piece_square = board.compute_static_scores()
+        board.find_kings_and_pawns()
+        return board
+
+    # FEN of the position; the board keeps no en passant square or move counters, so those fields are always "- 0 1"
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[BITBOARD_PIECES.index(type(piece))]
+                rank += letter.upper() if piece.color == 'white' else letter
+            ranks.append(rank + (str(empty) if empty else ''))
+        rights = ''.join(letter for bit, letter in enumerate('KQkq') if self.castling & (1 << bit)) or '-'
+        return f"{'/'.join(ranks)} {self.turn[0]} {rights} - 0 1"
+
+    def create_board(self):
+        board = [[None for _ in range(COLS)] for _ in range(ROWS)]
+        return board
+
+    def setup_pieces(self):
+        # set up pawns
+        for col in range(8):
+            self.board[1][col] = Pawn('black', (1, col))
+            self.board[6][col] = Pawn('white', (6, col))
+
+        # set up the rest
+        piece_order = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+        for col, piece_class in enumerate(piece_order):
+            self.board[0][col] = piece_class('black', (0, col))
+            self.board[7][col] = piece_class('white', (7, col))
+
+    # castling rights bits derived from the has_moved flags of the kings and corner rooks
+    def castling_rights(self):
+        rights = 0
+        for bit, (row, rook_col) in enumerate([(7, 7), (7, 0), (0, 7), (0, 0)]):
+            king = self.board[row][4]
+            rook = self.board[row][rook_col]
+            color = 'white' if row == 7 else 'black'
+            if isinstance(king, King) and not king.has_moved and king.color == color:
+                if isinstance(rook, Rook) and not rook.has_moved and rook.color == color:
+                    rights |= 1 << bit
+        return rights
+
+    # full recomputation, moves keep zobrist_key up to date incrementally
+    def compute_zobrist_key(self):
+        key = ZOBRIST_CASTLING[self.castling]
+        if self.turn == 'black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    key ^= ZOBRIST_PIECES[piece.code][row * 8 + col]
+        return key
+
+    # full recomputation of (material, piece_square), moves update them incrementally
+    def compute_static_scores(self):
+        material = piece_square = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    code = piece.code
+                    material += PIECE_MATERIAL[code]
+                    piece_square += PIECE_SQUARE_SCORES[code][row * 8 + col]
+        return material, piece_square
+
+    # king squares and pawns per file for the evaluation, and the number of pieces on the board (for
+    # the endgame tablebases), kept up to date by make_move
+    def find_kings_and_pawns(self):
+        self.king_positions = {'white': None, 'black': None}
+        self.pawn_files = {'white': [0] * 8, 'black': [0] * 8}
+        self.piece_count = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    self.piece_count += 1
+                if isinstance(piece, King):
+                    self.king_positions[piece.color] = (row, col)
+                elif isinstance(piece, Pawn):
+                    self.pawn_files[piece.color][col] += 1
+
+
+    def move_piece(self, start, end):
+        if self.is_valid_move(start, end):
+            undo = self.make_move(start, end)
+            piece, captured_piece = undo[2], undo[3]
+            if isinstance(captured_piece, King):
+                return True, piece.color
+            return True, None
+        return False, None
+
+    # plays a move in place without checking it and returns an undo record for unmake_move (used by the AI search)
+    def make_move(self, start, end):
+        start_row, start_col = start
+        end_row, end_col = end
+        piece = self.board[start_row][start_col]
+        captured_piece = self.board[end_row][end_col]
+        had_moved = piece.has_moved
+        undo_state = (self.zobrist_key, self.castling, self.material, self.piece_square)
+        start_sq = start_row * 8 + start_col
+        end_sq = end_row * 8 + end_col
+        new_piece = piece.move((end_row, end_col)) 
+        new_piece = new_piece if new_piece else piece
+        self.board[end_row][end_col] = new_piece
+        self.board[start_row][start_col] = None
+
+        code = piece.code
+        new_code = new_piece.code
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[code][start_sq] ^ ZOBRIST_PIECES[new_code][end_sq]
+        self.material += PIECE_MATERIAL[new_code] - PIECE_MATERIAL[code] # nonzero only for a promotion
+        self.piece_square += PIECE_SQUARE_SCORES[new_code][end_sq] - PIECE_SQUARE_SCORES[code][start_sq]
+        if captured_piece:
+            captured_code = captured_piece.code
+            key ^= ZOBRIST_PIECES[captured_code][end_sq]
+            self.material -= PIECE_MATERIAL[captured_code]
+            self.piece_square -= PIECE_SQUARE_SCORES[captured_code][end_sq]
+        self.update_kings_and_pawns(piece, new_piece, captured_piece, start, end, 1)
+
+        rook_move = None
+        if isinstance(piece, King) and abs(start_col - end_col) == 2:
+            rook_col, rook_end_col = (7, 5) if end_col == 6 else (0, 3) # kingside or queenside castling
+            rook = self.board[start_row][rook_col]
+            rook_move = (rook, rook_col, rook_end_col, rook.has_moved)
+            self.board[start_row][rook_end_col] = rook
+            self.board[start_row][rook_col] = None
+            rook.move((start_row, rook_end_col))
+            rook_code = rook.code
+            key ^= ZOBRIST_PIECES[rook_code][start_row * 8 + rook_col] ^ ZOBRIST_PIECES[rook_code][start_row * 8 + rook_end_col]
+            self.piece_square += PIECE_SQUARE_SCORES[rook_code][start_row * 8 + rook_end_col] - PIECE_SQUARE_SCORES[rook_code][start_row * 8 + rook_col]
+
+        if self.castling & ~(CASTLING_MASKS[start_sq] & CASTLING_MASKS[end_sq]): # only touching a king or rook square can change the rights
+            castling = self.castling_rights()
+            key ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+        self.zobrist_key = key
+        self.turn = 'black' if self.turn == 'white' else 'white'
+
+        return (start, end, piece, captured_piece, had_moved, rook_move, undo_state)
+
+    # takes back a move played with make_move, restoring captures, castling rooks, has_moved flags and promoted pawns
+    def unmake_move(self, undo):
+        start, end, piece, captured_piece, had_moved, rook_move, (self.zobrist_key, self.castling, self.material, self.piece_square) = undo
+        start_row, start_col = start
+        end_row, end_col = end
+        self.update_kings_and_pawns(piece, self.board[end_row][end_col], captured_piece, start, end, -1)
+        self.board[start_row][start_col] = piece
+        self.board[end_row][end_col] = captured_piece
+        piece.position = start
+        piece.has_moved = had_moved
+
+        if rook_move:
+            rook, rook_col, rook_end_col, rook_had_moved = rook_move
+            self.board[start_row][rook_col] = rook
+            self.board[start_row][rook_end_col] = None
+            rook.position = (start_row, rook_col)
+            rook.has_moved = rook_had_moved
+        self.turn = 'black' if self.turn == 'white' else 'white'
+
+    # direction 1 applies a move to king_positions and pawn_files, -1 takes it back
+    def update_kings_and_pawns(self, piece, new_piece, captured_piece, start, end, direction):
+        if isinstance(piece, King):
+            self.king_positions[piece.color] = end if direction == 1 else start
+        elif isinstance(piece, Pawn):
+            files = self.pawn_files[piece.color]
+            files[start[1]] -= direction
+            if new_piece is piece: # still a pawn, so not promoted
+                files[end[1]] += direction
+        if captured_piece:
+            self.piece_count -= direction
+        if isinstance(captured_piece, Pawn):
+            self.pawn_files[captured_piece.color][end[1]] -= direction
+        elif isinstance(captured_piece, King):
+            self.king_positions[captured_piece.color] = None if direction == 1 else end
+    
+    # read off the other side's cached attack map, which move generation builds for the king's moves anyway
+    def is_in_check(self, color):
+        king_position = self.king_positions[color]
+        if not king_position:
+            return False
+        return self.is_square_under_attack(king_position[0], king_position[1], color)
+
+    def is_square_under_attack(self, row, col, color):
+        opponent_color = 'black' if color == 'white' else 'white'
+        return self.attack_map(opponent_color)[row * 8 + col] > 0
+
+    # number of pieces of color attacking each square (row * 8 + col), built on first use and kept
+    # until the position changes
+    def attack_map(self, color):
+        return self.attack_data(color)[0]
+
+    # squares attacked by color that are not occupied by its own pieces, read off the attack map
+    def mobility(self, color):
+        return self.attack_data(color)[1]
+
+    def attack_data(self, color):
+        if self.attack_maps_key != self.zobrist_key:
+            self.attack_maps_key = self.zobrist_key
+            self.attack_maps = {}
+        if color not in self.attack_maps:
+            self.attack_maps[color] = self.build_attack_map(color)
+        return self.attack_maps[color]
+
+    def get_all_moves(self, color):
+        return [(start, move) for start, moves in self.moves_by_square(color).items() for move in moves]
+
+    # square -> legal moves of each of color's pieces, worked out once per position (so the GUI can ask
+    # every frame) and dropped when the position changes
+    def moves_by_square(self, color):
+        if self.legal_moves_key != self.zobrist_key:
+            self.legal_moves_key = self.zobrist_key
+            self.legal_moves = {}
+        if color not in self.legal_moves:
+            side = BITBOARD_COLORS.index(color)
+            moves = {}
+            for row in range(8):
+                for col in range(8):
+                    piece = self.board[row][col]
+                    if piece and piece.side == side:
+                        moves[(row, col)] = self.find_valid_moves(piece)
+            self.legal_moves[color] = moves
+        return self.legal_moves[color]
+
+    def piece_class_at(self, row, col):
+        piece = self.board[row][col]
+        return type(piece) if piece else None
+
+    def get_valid_moves(self, piece):
+        return list(self.moves_by_square(piece.color).get(piece.position, ()))
+
+    # filters the piece's pseudo-legal moves with the checks, pins and attacked squares of the
+    # position instead of trying each move on a copy of the board
+    def find_valid_moves(self, piece):
+        checkers, block_squares, pins = self.move_constraints(piece.color)
+        moves = piece.valid_moves(self.board)
+
+        if isinstance(piece, King):
+            attacked = self.attack_map('black' if piece.color == 'white' else 'white')
+            valid_moves = [move for move in moves if not attacked[move[0] * 8 + move[1]]]
+            if not checkers: # no castling out of check, through an attacked square or into check
+                row, col = piece.position
+                for move in piece.get_castling_moves(self.board):
+                    if not attacked[row * 8 + (col + move[1]) // 2] and not attacked[move[0] * 8 + move[1]]:
+                        valid_moves.append(move)
+            return valid_moves
+
+        if len(checkers) > 1: # only the king can answer a double check
+            return []
+        if piece.position in pins:
+            moves = [move for move in moves if move in pins[piece.position]]
+        if checkers: # capture the checking piece or block its ray
+            moves = [move for move in moves if move in block_squares]
+        return moves
+    
+    def is_valid_move(self, start, end):
+        piece = self.board[start[0]][start[1]]
+        return bool(piece) and tuple(end) in self.get_valid_moves(piece)
+
+    # (checking pieces, squares that stop a single check, pinned piece -> squares it may move to)
+    # for color's king, worked out once per position
+    def move_constraints(self, color):
+        cache_key = (self.zobrist_key, color)
+        if self.constraints_cache[0] != cache_key:
+            self.constraints_cache = (cache_key, self.find_checks_and_pins(color))
+        return self.constraints_cache[1]
+
+    def find_checks_and_pins(self, color):
+        checkers = []
+        block_squares = set()
+        pins = {}
+        king_position = self.king_positions[color]
+        if not king_position:
+            return checkers, block_squares, pins
+        board = self.board
+        side = BITBOARD_COLORS.index(color)
+        row, col = king_position
+
+        # walk out from the king: an enemy slider is either checking or, behind one of our pieces, pinning it
+        for drow, dcol in KING_STEPS:
+            slider = Bishop if drow and dcol else Rook
+            ray = []
+            pinned = None
+            r, c = row + drow, col + dcol
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append((r, c))
+                piece = board[r][c]
+                if piece:
+                    if piece.side == side:
+                        if pinned:
+                            break
+                        pinned = (r, c)
+                    else:
+                        if isinstance(piece, (slider, Queen)):
+                            if pinned:
+                                pins[pinned] = set(ray)
+                            else:
+                                checkers.append((r, c))
+                                block_squares.update(ray)
+                        break
+                r += drow
+                c += dcol
+
+        for drow, dcol in KNIGHT_STEPS:
+            r, c = row + drow, col + dcol
+            if 0 <= r < 8 and 0 <= c < 8 and isinstance(board[r][c], Knight) and board[r][c].side != side:
+                checkers.append((r, c))
+                block_squares.add((r, c))
+        pawn_row = row - 1 if color == 'white' else row + 1 # enemy pawns attacking the king stand in front of it
+        for c in (col - 1, col + 1):
+            if 0 <= pawn_row < 8 and 0 <= c < 8 and isinstance(board[pawn_row][c], Pawn) and board[pawn_row][c].side != side:
+                checkers.append((pawn_row, c))
+                block_squares.add((pawn_row, c))
+        return checkers, block_squares, pins
+
+    # returns (attacker counts, mobility) for color; the other king does not block, so it cannot
+    # step back along a checking ray
+    def build_attack_map(self, color):
+        board = self.board
+        enemy_king = self.king_positions['black' if color == 'white' else 'white']
+        side = BITBOARD_COLORS.index(color)
+        counts = [0] * 64
+        targets = []
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if not piece or piece.side != side:
+                    continue
+                if isinstance(piece, Pawn):
+                    r = row - 1 if color == 'white' else row + 1
+                    targets.extend((r, c) for c in (col - 1, col + 1) if 0 <= r < 8 and 0 <= c < 8)
+                elif isinstance(piece, (Knight, King)):
+                    for drow, dcol in KNIGHT_STEPS if isinstance(piece, Knight) else KING_STEPS:
+                        if 0 <= row + drow < 8 and 0 <= col + dcol < 8:
+                            targets.append((row + drow, col + dcol))
+                else:
+                    for drow, dcol in SLIDER_DIRECTIONS[type(piece)]:
+                        r, c = row + drow, col + dcol
+                        while 0 <= r < 8 and 0 <= c < 8:
+                            targets.append((r, c))
+                            if board[r][c] and (r, c) != enemy_king:
+                                break
+                            r += drow
+                            c += dcol
+
+        mobility = 0
+        for r, c in targets:
+            counts[r * 8 + c] += 1
+            target = board[r][c]
+            if not target or target.side != side:
+                mobility += 1
+        return counts, mobility
+
+# bitboard backend: one 64-bit integer per piece type and color, bit (row * 8 + col) set where that piece stands
+FULL_BOARD = (1 << 64) - 1
+ROW_MASKS = [0xFF << (8 * row) for row in range(8)]
+FILE_MASKS = [0x0101010101010101 << col for col in range(8)]
+
+def build_step_attacks(steps):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        attacks = 0
+        for drow, dcol in steps:
+            if 0 <= row + drow < 8 and 0 <= col + dcol < 8:
+                attacks |= 1 << ((row + drow) * 8 + col + dcol)
+        table.append(attacks)
+    return table
+
+KNIGHT_ATTACKS = build_step_attacks([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)])
+KING_ATTACKS = build_step_attacks([(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)])
+PAWN_ATTACKS = [build_step_attacks([(-1, -1), (-1, 1)]), build_step_attacks([(1, -1), (1, 1)])] # white moves up the board (row - 1)
+
+# classical ray lookups: the ray is cut at the first blocker, which is the lowest set bit for
+# directions that increase the square index and the highest set bit for the others
+ROOK_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+RAYS = {direction: [] for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+for (drow, dcol), rays in RAYS.items():
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        ray = 0
+        for i in range(1, 8):
+            if not (0 <= row + drow * i < 8 and 0 <= col + dcol * i < 8):
+                break
+            ray |= 1 << ((row + drow * i) * 8 + col + dcol * i)
+        rays.append(ray)
+ROOK_RAYS = [(RAYS[(drow, dcol)], drow * 8 + dcol > 0) for drow, dcol in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(RAYS[(drow, dcol)], drow * 8 + dcol > 0) for drow, dcol in BISHOP_DIRECTIONS]
+
+def sliding_attacks(sq, occupied, ray_tables):
+    attacks = 0
+    for rays, positive in ray_tables:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            ray ^= rays[first]
+        attacks |= ray
+    return attacks
+
+def count_bits(bitboard):
+    return bin(bitboard).count('1')
+
+def iterate_bits(bitboard):
+    while bitboard:
+        low_bit = bitboard & -bitboard
+        yield low_bit.bit_length() - 1
+        bitboard ^= low_bit
+
+class BitBoard:
+    def __init__(self):
+        self.pieces = [0] * 12 # indexed by color * 6 + piece type
+        self.occupied = [0, 0]
+        self.squares = [None] * 64 # piece code on each square, for fast captures and undo
+        self.castling = 15
+        self.turn = 'white'
+        self.zobrist_key = ZOBRIST_CASTLING[15]
+        self.material = self.piece_square = 0
+        self.setup_pieces()
+
+    def setup_pieces(self):
+        piece_order = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+        for col in range(8):
+            self.put_piece(6 + PAWN, 8 + col) # black pawns on row 1
+            self.put_piece(PAWN, 48 + col)
+            self.put_piece(6 + piece_order[col], col)
+            self.put_piece(piece_order[col], 56 + col)
+
+    # copies a Board position, deriving castling rights from the has_moved flags
+    @classmethod
+    def from_board(cls, board, turn=None):
+        bitboard = cls.__new__(cls)
+        bitboard.pieces = [0] * 12
+        bitboard.occupied = [0, 0]
+        bitboard.squares = [None] * 64
+        bitboard.turn = turn or board.turn
+        bitboard.castling = board.castling_rights()
+        bitboard.zobrist_key = ZOBRIST_CASTLING[bitboard.castling]
+        bitboard.material = bitboard.piece_square = 0
+        if bitboard.turn == 'black':
+            bitboard.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if piece:
+                    bitboard.put_piece(piece.code, row * 8 + col)
+        return bitboard
+
+    @property
+    def piece_count(self):
+        return count_bits(self.occupied[0] | self.occupied[1])
+
+    def put_piece(self, code, sq):
+        self.pieces[code] |= 1 << sq
+        self.occupied[code // 6] |= 1 << sq
+        self.squares[sq] = code
+        self.zobrist_key ^= ZOBRIST_PIECES[code][sq]
+        self.material += PIECE_MATERIAL[code]
+        self.piece_square += PIECE_SQUARE_SCORES[code][sq]
+
+    # full recomputation of (material, piece_square), moves update them incrementally
+    def compute_static_scores(self):
+        material = piece_square = 0
+        for code in range(12):
+            for sq in iterate_bits(self.pieces[code]):
+                material += PIECE_MATERIAL[code]
+                piece_square += PIECE_SQUARE_SCORES[code][sq]
+        return material, piece_square
+
+    # occupied can be given to look through a piece, such as a king stepping back along a checking ray
+    def is_square_attacked(self, sq, by_color, occupied=None):
+        pieces = self.pieces
+        base = by_color * 6
+        if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT] or KING_ATTACKS[sq] & pieces[base + KING]:
+            return True
+        if PAWN_ATTACKS[1 - by_color][sq] & pieces[base + PAWN]: # a pawn attacks sq if sq's own pawn attacks would hit it
+            return True
+        if occupied is None:
+            occupied = self.occupied[0] | self.occupied[1]
+        queens = pieces[base + QUEEN]
+        if sliding_attacks(sq, occupied, ROOK_RAYS) & (pieces[base + ROOK] | queens):
+            return True
+        return bool(sliding_attacks(sq, occupied, BISHOP_RAYS) & (pieces[base + BISHOP] | queens))
+
+    # squares attacked by color's pieces (counted once per attacker) that are not occupied by its own
+    # pieces, with the other king not blocking, the same count as Board.mobility
+    def mobility(self, color):
+        side = BITBOARD_COLORS.index(color)
+        pieces = self.pieces
+        base = side * 6
+        own = self.occupied[side]
+        occupied = (own | self.occupied[1 - side]) & ~pieces[(1 - side) * 6 + KING]
+        not_own = ~own & FULL_BOARD
+
+        pawns = pieces[base + PAWN]
+        if side == 0:
+            count = count_bits(((pawns & ~FILE_MASKS[0]) >> 9) & not_own) + count_bits(((pawns & ~FILE_MASKS[7]) >> 7) & not_own)
+        else:
+            count = count_bits(((pawns & ~FILE_MASKS[0]) << 7) & not_own) + count_bits(((pawns & ~FILE_MASKS[7]) << 9) & not_own)
+
+        for sq in iterate_bits(pieces[base + KNIGHT]):
+            count += count_bits(KNIGHT_ATTACKS[sq] & not_own)
+        for sq in iterate_bits(pieces[base + BISHOP] | pieces[base + QUEEN]):
+            count += count_bits(sliding_attacks(sq, occupied, BISHOP_RAYS) & not_own)
+        for sq in iterate_bits(pieces[base + ROOK] | pieces[base + QUEEN]):
+            count += count_bits(sliding_attacks(sq, occupied, ROOK_RAYS) & not_own)
+        for sq in iterate_bits(pieces[base + KING]):
+            count += count_bits(KING_ATTACKS[sq] & not_own)
+        return count
+
+    def is_in_check(self, color):
+        side = BITBOARD_COLORS.index(color)
+        king = self.pieces[side * 6 + KING]
+        if not king:
+            return False
+        return self.is_square_attacked(king.bit_length() - 1, 1 - side)
+
+    def pseudo_legal_moves(self, side):
+        moves = []
+        pieces = self.pieces
+        base = side * 6
+        own = self.occupied[side]
+        enemy = self.occupied[1 - side]
+        occupied = own | enemy
+        empty = ~occupied & FULL_BOARD
+
+        pawns = pieces[base + PAWN]
+        if side == 0:
+            single = (pawns >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty
+            moves.extend((to + 8, to) for to in iterate_bits(single))
+            moves.extend((to + 16, to) for to in iterate_bits(double))
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty
+            moves.extend((to - 8, to) for to in iterate_bits(single))
+            moves.extend((to - 16, to) for to in iterate_bits(double))
+        pawn_attacks = PAWN_ATTACKS[side]
+        for sq in iterate_bits(pawns):
+            moves.extend((sq, to) for to in iterate_bits(pawn_attacks[sq] & enemy))
+
+        for sq in iterate_bits(pieces[base + KNIGHT]):
+            moves.extend((sq, to) for to in iterate_bits(KNIGHT_ATTACKS[sq] & ~own))
+        for sq in iterate_bits(pieces[base + BISHOP]):
+            moves.extend((sq, to) for to in iterate_bits(sliding_attacks(sq, occupied, BISHOP_RAYS) & ~own))
+        for sq in iterate_bits(pieces[base + ROOK]):
+            moves.extend((sq, to) for to in iterate_bits(sliding_attacks(sq, occupied, ROOK_RAYS) & ~own))
+        for sq in iterate_bits(pieces[base + QUEEN]):
+            attacks = sliding_attacks(sq, occupied, ROOK_RAYS) | sliding_attacks(sq, occupied, BISHOP_RAYS)
+            moves.extend((sq, to) for to in iterate_bits(attacks & ~own))
+        for sq in iterate_bits(pieces[base + KING]):
+            moves.extend((sq, to) for to in iterate_bits(KING_ATTACKS[sq] & ~own))
+            moves.extend(self.castling_moves(side, sq, occupied))
+        return moves
+
+    # same rules as King.get_castling_moves plus the attacked-square checks in Board.get_valid_moves
+    def castling_moves(self, side, king_sq, occupied):
+        moves = []
+        home = 60 if side == 0 else 4
+        if king_sq != home:
+            return moves
+        rights = self.castling >> (2 * side)
+        if rights & 1 and not occupied & (3 << (home + 1)) and self.pieces[side * 6 + ROOK] & (1 << (home + 3)):
+            if not self.is_square_attacked(home, 1 - side) and not self.is_square_attacked(home + 1, 1 - side):
+                moves.append((home, home + 2))
+        if rights & 2 and not occupied & (7 << (home - 3)) and self.pieces[side * 6 + ROOK] & (1 << (home - 4)):
+            if not self.is_square_attacked(home, 1 - side) and not self.is_square_attacked(home - 1, 1 - side):
+                moves.append((home, home - 2))
+        return moves
+
+    # filters the pseudo-legal moves with the checks and pins of the position, like Board.find_valid_moves:
+    # the king may not step onto an attacked square, and other pieces must answer a check and stay on
+    # their pin ray
+    def legal_moves(self, color):
+        side = BITBOARD_COLORS.index(color)
+        moves = self.pseudo_legal_moves(side)
+        king = self.pieces[side * 6 + KING]
+        if not king:
+            return moves
+        king_sq = king.bit_length() - 1
+        checkers, check_mask, pins = self.checks_and_pins(side, king_sq)
+        occupied = (self.occupied[0] | self.occupied[1]) ^ king # the king does not block the ray it steps back along
+        legal = []
+        for start, end in moves:
+            if start == king_sq:
+                if not self.is_square_attacked(end, 1 - side, occupied):
+                    legal.append((start, end))
+            elif checkers < 2 and (not checkers or check_mask >> end & 1) and (start not in pins or pins[start] >> end & 1):
+                legal.append((start, end))
+        return legal
+
+    # (number of pieces checking side's king, squares that stop a single check, pinned square -> squares it
+    # may move to); walks every ray out from the king, an enemy slider being either the first piece on it
+    # (a check) or the second, behind one of side's pieces (a pin)
+    def checks_and_pins(self, side, king_sq):
+        pieces = self.pieces
+        enemy_base = (1 - side) * 6
+        own = self.occupied[side]
+        occupied = own | self.occupied[1 - side]
+        knights = KNIGHT_ATTACKS[king_sq] & pieces[enemy_base + KNIGHT]
+        pawns = PAWN_ATTACKS[side][king_sq] & pieces[enemy_base + PAWN]
+        check_mask = knights | pawns
+        checkers = count_bits(check_mask)
+        pins = {}
+        queens = pieces[enemy_base + QUEEN]
+        for ray_tables, sliders in ((ROOK_RAYS, pieces[enemy_base + ROOK] | queens), (BISHOP_RAYS, pieces[enemy_base + BISHOP] | queens)):
+            for rays, positive in ray_tables:
+                ray = rays[king_sq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                if sliders >> first & 1:
+                    checkers += 1
+                    check_mask |= ray ^ rays[first]
+                elif own >> first & 1:
+                    blockers = rays[first] & occupied
+                    if not blockers:
+                        continue
+                    second = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                    if sliders >> second & 1:
+                        pins[first] = ray ^ rays[second]
+        return checkers, check_mask, pins
+
+    def piece_class_at(self, row, col):
+        code = self.squares[row * 8 + col]
+        return BITBOARD_PIECES[code % 6] if code is not None else None
+
+    # same move format as Board: ((start_row, start_col), (end_row, end_col))
+    def get_all_moves(self, color):
+        return [(divmod(start, 8), divmod(end, 8)) for start, end in self.legal_moves(color)]
+
+    def make_move(self, start, end):
+        return self.make_square_move(start[0] * 8 + start[1], end[0] * 8 + end[1])
+
+    def make_square_move(self, start, end):
+        pieces = self.pieces
+        squares = self.squares
+        code = squares[start]
+        captured = squares[end]
+        side = code // 6
+        move_bits = (1 << start) | (1 << end)
+        undo = (start, end, code, captured, self.castling, self.zobrist_key, self.material, self.piece_square)
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[code][start]
+        piece_square = self.piece_square - PIECE_SQUARE_SCORES[code][start]
+
+        if captured is not None:
+            pieces[captured] ^= 1 << end
+            self.occupied[1 - side] ^= 1 << end
+            key ^= ZOBRIST_PIECES[captured][end]
+            self.material -= PIECE_MATERIAL[captured]
+            piece_square -= PIECE_SQUARE_SCORES[captured][end]
+        pieces[code] ^= move_bits
+        self.occupied[side] ^= move_bits
+        squares[end] = code
+        squares[start] = None
+
+        piece_type = code - side * 6
+        if piece_type == PAWN and (end < 8 or end >= 56): # queen me
+            pieces[code] ^= 1 << end
+            pieces[code + QUEEN - PAWN] |= 1 << end
+            squares[end] = code + QUEEN - PAWN
+            self.material += PIECE_MATERIAL[code + QUEEN - PAWN] - PIECE_MATERIAL[code]
+        elif piece_type == KING and abs(start - end) == 2:
+            rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+            rook_bits = (1 << rook_start) | (1 << rook_end)
+            pieces[side * 6 + ROOK] ^= rook_bits
+            self.occupied[side] ^= rook_bits
+            squares[rook_end] = squares[rook_start]
+            squares[rook_start] = None
+            key ^= ZOBRIST_PIECES[side * 6 + ROOK][rook_start] ^ ZOBRIST_PIECES[side * 6 + ROOK][rook_end]
+            piece_square += PIECE_SQUARE_SCORES[side * 6 + ROOK][rook_end] - PIECE_SQUARE_SCORES[side * 6 + ROOK][rook_start]
+        key ^= ZOBRIST_PIECES[squares[end]][end]
+        self.piece_square = piece_square + PIECE_SQUARE_SCORES[squares[end]][end]
+
+        castling = self.castling & CASTLING_MASKS[start] & CASTLING_MASKS[end]
+        self.zobrist_key = key ^ ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+        self.castling = castling
+        self.turn = 'black' if self.turn == 'white' else 'white'
+        return undo
+
+    def unmake_move(self, undo):
+        start, end, code, captured, castling, zobrist_key, self.material, self.piece_square = undo
+        pieces = self.pieces
+        squares = self.squares
+        side = code // 6
+        move_bits = (1 << start) | (1 << end)
+
+        if squares[end] != code: # undo promotion
+            pieces[squares[end]] ^= 1 << end
+            pieces[code] |= 1 << end
+        pieces[code] ^= move_bits
+        self.occupied[side] ^= move_bits
+        squares[start] = code
+        squares[end] = captured
+        if captured is not None:
+            pieces[captured] |= 1 << end
+            self.occupied[1 - side] |= 1 << end
+
+        if code - side * 6 == KING and abs(start - end) == 2:
+            rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+            rook_bits = (1 << rook_start) | (1 << rook_end)
+            pieces[side * 6 + ROOK] ^= rook_bits
+            self.occupied[side] ^= rook_bits
+            squares[rook_start] = squares[rook_end]
+            squares[rook_end] = None
+
+        self.castling = castling
+        self.zobrist_key = zobrist_key
+        self.turn = 'black' if self.turn == 'white' else 'white'
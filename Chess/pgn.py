@@ -0,0 +1,182 @@
+import re
+import textwrap
+from engine import Board, Pawn, King, BITBOARD_PIECES, FEN_LETTERS, square_name, parse_square
+
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+TOKEN_PATTERN = re.compile(r'[{}();]|\$\d+|[^\s{}();]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.*')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SEVEN_TAG_ROSTER = [('Event', '?'), ('Site', '?'), ('Date', '????.??.??'), ('Round', '?'), ('White', '?'), ('Black', '?')]
+
+# standard algebraic notation (Nf3, exd5, O-O, e8=Q+) of a legal move on board, which is left unchanged
+def move_to_san(board, move):
+    start, end = move
+    piece_class = board.piece_class_at(*start)
+    if piece_class is King and abs(start[1] - end[1]) == 2:
+        san = 'O-O' if end[1] == 6 else 'O-O-O'
+    else:
+        capture = 'x' if board.piece_class_at(*end) else ''
+        if piece_class is Pawn:
+            san = (square_name(start)[0] + capture if capture else '') + square_name(end)
+            if end[0] in (0, 7):
+                san += '=Q' # pawns always promote to a queen
+        else:
+            rivals = [other for other, other_end in board.get_all_moves(board.turn)
+                      if other_end == end and other != start and board.piece_class_at(*other) is piece_class]
+            if not rivals:
+                origin = ''
+            elif all(other[1] != start[1] for other in rivals):
+                origin = square_name(start)[0]
+            elif all(other[0] != start[0] for other in rivals):
+                origin = square_name(start)[1]
+            else:
+                origin = square_name(start)
+            san = FEN_LETTERS[BITBOARD_PIECES.index(piece_class)].upper() + origin + capture + square_name(end)
+
+    undo = board.make_move(*move)
+    if board.is_in_check(board.turn):
+        san += '+' if board.get_all_moves(board.turn) else '#'
+    board.unmake_move(undo)
+    return san
+
+# the legal move on board written as san; raises ValueError if there is none (or more than one)
+def san_to_move(board, san):
+    text = san.rstrip('+#!?')
+    legal = board.get_all_moves(board.turn)
+    if text in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        row = 7 if board.turn == 'white' else 0
+        move = ((row, 4), (row, 6 if len(text) == 3 else 2))
+        if move in legal and board.piece_class_at(row, 4) is King:
+            return move
+        raise ValueError(f'illegal move {san}')
+
+    match = SAN_PATTERN.match(text)
+    if not match:
+        raise ValueError(f'not a SAN move: {san}')
+    letter, from_file, from_rank, target, promotion = match.groups()
+    if promotion and promotion != 'Q':
+        raise ValueError(f'under-promotion is not supported: {san}')
+    piece_class = BITBOARD_PIECES[FEN_LETTERS.index(letter.lower())] if letter else Pawn
+    end = parse_square(target)
+    candidates = [(start, move_end) for start, move_end in legal
+                  if move_end == end and board.piece_class_at(*start) is piece_class
+                  and (not from_file or square_name(start)[0] == from_file)
+                  and (not from_rank or square_name(start)[1] == from_rank)]
+    if len(candidates) != 1:
+        raise ValueError(f'{"ambiguous" if candidates else "illegal"} move {san}')
+    return candidates[0]
+
+class Game:
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers is not None else {}
+        self.moves = moves if moves is not None else [] # SAN strings
+        self.result = result
+
+    # builds a game from moves in board coordinates, played from board (the start position by default)
+    @classmethod
+    def from_moves(cls, moves, result='*', board=None, **headers):
+        if board is not None:
+            headers.setdefault('FEN', board.to_fen())
+            headers.setdefault('SetUp', '1')
+        board = Board.from_fen(headers['FEN']) if 'FEN' in headers else Board()
+        san_moves = []
+        for move in moves:
+            san_moves.append(move_to_san(board, move))
+            board.make_move(*move)
+        return cls(headers, san_moves, result)
+
+    def start_board(self):
+        return Board.from_fen(self.headers['FEN']) if 'FEN' in self.headers else Board()
+
+    # yields (board, move) for each move of the game, board being the position before the move;
+    # the same board is played forward afterwards, so copy it if it has to be kept. Raises ValueError
+    # at a move the board cannot play (en passant or an under-promotion) or a bad FEN header
+    def replay(self):
+        board = self.start_board()
+        for san in self.moves:
+            move = san_to_move(board, san)
+            yield board, move
+            board.make_move(*move)
+
+    # FEN of the position before each move, e.g. to feed analysis.analyse_positions
+    def fens(self):
+        for board, move in self.replay():
+            yield board.to_fen()
+
+# yields one Game at a time from lines of PGN text (an open file works), so files of any size can be read;
+# comments, variations and numeric annotations are skipped
+def read_games(lines):
+    headers = {}
+    moves = []
+    in_comment = False
+    variation_depth = 0
+    for line in lines:
+        if not in_comment and line.startswith('['):
+            match = HEADER_PATTERN.match(line)
+            if match:
+                if moves: # a game without a result token ends at the next header
+                    yield Game(headers, moves, headers.get('Result', '*'))
+                    headers, moves = {}, []
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+        if line.startswith('%'): # escape mechanism, the rest of the line is ignored
+            continue
+
+        for token in TOKEN_PATTERN.findall(line):
+            if in_comment:
+                in_comment = token != '}'
+            elif token == '{':
+                in_comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                variation_depth += 1
+            elif token == ')':
+                variation_depth = max(0, variation_depth - 1)
+            elif variation_depth or token.startswith('$'):
+                continue
+            elif token in RESULTS:
+                yield Game(headers, moves, token)
+                headers, moves = {}, []
+            else:
+                token = MOVE_NUMBER_PATTERN.sub('', token)
+                if token:
+                    moves.append(token)
+    if moves or headers:
+        yield Game(headers, moves, headers.get('Result', '*'))
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+# writes a game as PGN: the seven tag roster first, then other headers and the move text wrapped at 80 columns
+def write_game(file, game):
+    headers = dict(SEVEN_TAG_ROSTER)
+    headers.update(game.headers)
+    headers['Result'] = game.result
+    for name in [name for name, _ in SEVEN_TAG_ROSTER] + ['Result']:
+        file.write(f'[{name} "{escape(headers.pop(name))}"]\n')
+    for name, value in headers.items():
+        file.write(f'[{name} "{escape(value)}"]\n')
+    file.write('\n')
+
+    fen_fields = game.headers.get('FEN', '').split()
+    number = int(fen_fields[5]) if len(fen_fields) > 5 else 1
+    white_to_move = len(fen_fields) < 2 or fen_fields[1] == 'w'
+    tokens = []
+    for san in game.moves:
+        if white_to_move:
+            tokens.append(f'{number}.')
+        elif not tokens:
+            tokens.append(f'{number}...')
+        tokens.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(game.result)
+    file.write(textwrap.fill(' '.join(tokens), 79) + '\n\n')
+
+# writes every game of an iterable, one at a time
+def write_games(file, games):
+    for game in games:
+        write_game(file, game)
@@ -0,0 +1,162 @@
+import os
+import csv
+import math
+import time
+import random
+import argparse
+import multiprocessing
+from engine import Board, ChessAI
+from book import OpeningBook
+
+# a config is ChessAI keyword arguments, plus move_time (seconds per move) to search on the clock instead of
+# to a fixed depth; book is the path of an opening book file
+CONFIG_TYPES = {'depth': int, 'backend': str, 'hash_mb': int, 'move_ordering': bool, 'quiescence': bool,
+                'fast_eval': bool, 'move_time': float, 'book': str, 'shield_weight': int, 'open_file_weight': int,
+                'mobility_weight': int}
+
+# "depth=3,quiescence=0" -> {'depth': 3, 'quiescence': False}
+def parse_config(text):
+    config = {}
+    for item in filter(None, text.split(',')):
+        name, value = item.split('=')
+        value_type = CONFIG_TYPES[name]
+        config[name] = value not in ('0', 'false', 'False') if value_type is bool else value_type(value)
+    return config
+
+# a few random legal moves from the start position, the same for both games of a pair
+def random_opening(seed, plies):
+    rng = random.Random(seed)
+    board = Board()
+    moves = []
+    for _ in range(plies):
+        legal = board.get_all_moves(board.turn)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.move_piece(*move)
+        moves.append(move)
+    return moves
+
+# plays one game and returns (result for white: 1, 0.5 or 0, reason, plies, {color: seconds spent on each move})
+def play_game(white_config, black_config, opening, max_plies):
+    board = Board()
+    for move in opening:
+        board.move_piece(*move)
+    players = {}
+    books = []
+    for color, config in (('white', white_config), ('black', black_config)):
+        config = dict(config)
+        move_time = config.pop('move_time', None)
+        if 'book' in config:
+            config['book'] = OpeningBook(config['book'])
+            books.append(config['book'])
+        players[color] = (ChessAI(color, **config), move_time)
+    try:
+        return play_moves(board, players, len(opening), max_plies)
+    finally:
+        for book in books:
+            book.close()
+
+# the rest of play_game: the engines play on from first_ply
+def play_moves(board, players, first_ply, max_plies):
+    think_time = {'white': [], 'black': []}
+    seen = {board.zobrist_key: 1}
+
+    for ply in range(first_ply, max_plies):
+        color = board.turn
+        if not board.get_all_moves(color):
+            if board.is_in_check(color):
+                return (0 if color == 'white' else 1), 'checkmate', ply, think_time
+            return 0.5, 'stalemate', ply, think_time
+
+        ai, move_time = players[color]
+        start = time.perf_counter()
+        move = ai.choose_move(board, move_time=move_time)
+        think_time[color].append(time.perf_counter() - start)
+        if move is None: # counted as a loss rather than ending the whole run
+            return (0 if color == 'white' else 1), 'no move', ply, think_time
+        board.move_piece(*move)
+
+        seen[board.zobrist_key] = seen.get(board.zobrist_key, 0) + 1
+        if seen[board.zobrist_key] >= 3:
+            return 0.5, 'repetition', ply + 1, think_time
+    return 0.5, 'move limit', max_plies, think_time
+
+# one entry of the pool: game (index, seed, A plays white?) -> a result row from A's side
+def run_game(job):
+    index, seed, a_is_white, config_a, config_b, opening_plies, max_plies = job
+    opening = random_opening(seed, opening_plies)
+    white, black = (config_a, config_b) if a_is_white else (config_b, config_a)
+    result, reason, plies, think_time = play_game(white, black, opening, max_plies)
+    times_a = think_time['white' if a_is_white else 'black']
+    times_b = think_time['black' if a_is_white else 'white']
+    return {
+        'game': index,
+        'seed': seed,
+        'a_color': 'white' if a_is_white else 'black',
+        'score_a': result if a_is_white else 1 - result,
+        'reason': reason,
+        'plies': plies,
+        'a_ms_per_move': round(1000 * sum(times_a) / len(times_a), 1) if times_a else 0,
+        'b_ms_per_move': round(1000 * sum(times_b) / len(times_b), 1) if times_b else 0,
+    }
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+# Elo difference of A over B and its 95% interval, from the mean and spread of the game scores
+def elo_estimate(scores):
+    n = len(scores)
+    mean = sum(scores) / n
+    variance = sum((score - mean) ** 2 for score in scores) / n
+    margin = 1.96 * math.sqrt(variance / n)
+    return elo_from_score(mean), elo_from_score(mean - margin), elo_from_score(mean + margin)
+
+def report(rows):
+    scores = [row['score_a'] for row in rows]
+    wins = scores.count(1)
+    draws = scores.count(0.5)
+    losses = scores.count(0)
+    elo, low, high = elo_estimate(scores)
+    print(f'games {len(rows)}: A wins {wins}, draws {draws}, losses {losses} (score {sum(scores) / len(scores):.3f})')
+    print(f'Elo A - B: {elo:+.0f} (95% interval {low:+.0f} to {high:+.0f})')
+    for engine in ('a', 'b'):
+        times = [row[f'{engine}_ms_per_move'] for row in rows]
+        print(f'{engine.upper()} average time per move: {sum(times) / len(times):.1f} ms')
+
+def main():
+    parser = argparse.ArgumentParser(description='Play two ChessAI configurations against each other.')
+    parser.add_argument('--a', default='depth=2', help='engine A, e.g. "depth=3,quiescence=0"')
+    parser.add_argument('--b', default='depth=2')
+    parser.add_argument('--games', type=int, default=20, help='rounded up to an even number, each opening is played with both colors')
+    parser.add_argument('--opening-plies', type=int, default=6, help='random moves played before the engines take over')
+    parser.add_argument('--max-plies', type=int, default=200, help='games still going after this many plies are drawn')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='selfplay.csv')
+    args = parser.parse_args()
+
+    config_a = parse_config(args.a)
+    config_b = parse_config(args.b)
+    jobs = []
+    for pair in range((args.games + 1) // 2):
+        seed = args.seed * 100003 + pair
+        for a_is_white in (True, False):
+            jobs.append((len(jobs), seed, a_is_white, config_a, config_b, args.opening_plies, args.max_plies))
+
+    rows = []
+    with multiprocessing.Pool(args.processes) as pool, open(args.output, 'w', newline='') as file:
+        writer = None
+        for row in pool.imap_unordered(run_game, jobs):
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            file.flush()
+            rows.append(row)
+            print(f"game {row['game']}: A ({row['a_color']}) scores {row['score_a']} by {row['reason']} after {row['plies']} plies")
+    report(rows)
+
+if __name__ == '__main__':
+    main()
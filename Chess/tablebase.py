@@ -0,0 +1,259 @@
+import os
+import time
+import argparse
+from engine import BitBoard, BITBOARD_PIECES, TABLEBASE_PIECES, Pawn, Knight, Bishop, Rook, Queen, King
+
+# distance-to-mate tables for king and queen, rook or pawn against a lone king, generated here by
+# retrograde analysis (run this file once) and saved next to it. A table is indexed by (strong king, piece, weak king)
+# squares (square = row * 8 + col, with the strong side moving up the board like white) and holds the
+# number of plies to mate for the strong side, or NOT_WON for a draw or an illegal position.
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebases')
+TABLE_PIECES = {Queen: 'KQK', Rook: 'KRK', Pawn: 'KPK'}
+NOT_WON = 255
+TABLEBASE_WIN = 10000 # score of a won position before subtracting the plies to mate; above any evaluation
+PROBE_CACHE_SIZE = 1 << 16
+
+KING_NEIGHBORS = [[(row + drow) * 8 + col + dcol for drow in (-1, 0, 1) for dcol in (-1, 0, 1)
+                   if (drow or dcol) and 0 <= row + drow < 8 and 0 <= col + dcol < 8]
+                  for row in range(8) for col in range(8)]
+ADJACENT = [[b in KING_NEIGHBORS[a] for b in range(64)] for a in range(64)]
+PAWN_ATTACKS = [[(row - 1) * 8 + col + dcol for dcol in (-1, 1) if row > 0 and 0 <= col + dcol < 8]
+                for row in range(8) for col in range(8)] # pawns move towards row 0
+ROOK_STEPS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+QUEEN_STEPS = ROOK_STEPS + [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+# squares strictly between a and b for each direction a slider moves in, None if they are not on one line
+def build_between(steps):
+    between = [[None] * 64 for _ in range(64)]
+    for a in range(64):
+        for drow, dcol in steps:
+            row, col = a // 8 + drow, a % 8 + dcol
+            squares = []
+            while 0 <= row < 8 and 0 <= col < 8:
+                between[a][row * 8 + col] = list(squares)
+                squares.append(row * 8 + col)
+                row, col = row + drow, col + dcol
+    return between
+
+BETWEEN = {Queen: build_between(QUEEN_STEPS), Rook: build_between(ROOK_STEPS)}
+
+# does the strong piece on piece_sq attack target, with the strong king on king_sq as the only blocker
+def piece_attacks(piece_class, piece_sq, target, king_sq):
+    if piece_class is Pawn:
+        return target in PAWN_ATTACKS[piece_sq]
+    between = BETWEEN[piece_class][piece_sq][target]
+    return between is not None and king_sq not in between
+
+# slider destinations from piece_sq, stopping before either king (they never capture a king)
+def slider_squares(piece_class, piece_sq, strong_king, weak_king):
+    squares = []
+    for drow, dcol in QUEEN_STEPS if piece_class is Queen else ROOK_STEPS:
+        row, col = piece_sq // 8 + drow, piece_sq % 8 + dcol
+        while 0 <= row < 8 and 0 <= col < 8 and row * 8 + col not in (strong_king, weak_king):
+            squares.append(row * 8 + col)
+            row, col = row + drow, col + dcol
+    return squares
+
+# squares the pawn could have come from (one step back, or two from its starting row), both kings kept clear
+def pawn_origins(piece_sq, strong_king, weak_king):
+    row = piece_sq // 8
+    origins = []
+    if row < 6 and piece_sq + 8 not in (strong_king, weak_king):
+        origins.append(piece_sq + 8)
+        if row == 4 and piece_sq + 16 not in (strong_king, weak_king):
+            origins.append(piece_sq + 16)
+    return origins
+
+# builds (strong side to move, weak side to move) tables for one piece class; promotion_table is the
+# weak-side-to-move KQK table, needed for KPK
+def generate_table(piece_class, promotion_table=None):
+    size = 64 * 64 * 64
+    strong_dtm = bytearray([NOT_WON]) * size
+    weak_dtm = bytearray([NOT_WON]) * size
+    strong_legal = bytearray(size)
+    weak_legal = bytearray(size)
+    weak_moves_left = bytearray(size) # legal weak king moves not yet known to lose
+    buckets = {} # plies to mate -> positions found at that distance, ('strong' or 'weak', index)
+    piece_squares = range(8, 56) if piece_class is Pawn else range(64)
+
+    for strong_king in range(64):
+        for piece_sq in piece_squares:
+            if piece_sq == strong_king:
+                continue
+            for weak_king in range(64):
+                if weak_king in (strong_king, piece_sq) or ADJACENT[strong_king][weak_king]:
+                    continue
+                index = (strong_king * 64 + piece_sq) * 64 + weak_king
+                weak_legal[index] = 1
+                in_check = piece_attacks(piece_class, piece_sq, weak_king, strong_king)
+                if not in_check:
+                    strong_legal[index] = 1
+
+                moves = 0
+                for target in KING_NEIGHBORS[weak_king]:
+                    if ADJACENT[strong_king][target]:
+                        continue
+                    if target == piece_sq:
+                        moves += 1 # capturing the piece draws (it cannot be defended by itself)
+                    elif not piece_attacks(piece_class, piece_sq, target, strong_king):
+                        moves += 1
+                weak_moves_left[index] = moves
+                if moves == 0 and in_check:
+                    buckets.setdefault(0, []).append(('weak', index))
+
+                # promoting into a KQK position the weak side loses
+                if piece_class is Pawn and piece_sq < 16 and not in_check and piece_sq - 8 not in (strong_king, weak_king):
+                    dtm = promotion_table[(strong_king * 64 + piece_sq - 8) * 64 + weak_king]
+                    if dtm != NOT_WON:
+                        buckets.setdefault(dtm + 1, []).append(('strong', index))
+
+    # positions are settled in order of distance to mate: the strong side takes the quickest win it
+    # finds, the weak side only loses once every one of its moves is known to lose (the last one found
+    # being the longest)
+    ply = 0
+    while ply <= max(buckets, default=-1):
+        for side, index in buckets.pop(ply, []):
+            strong_king, rest = divmod(index, 64 * 64)
+            piece_sq, weak_king = divmod(rest, 64)
+            if side == 'weak':
+                if weak_dtm[index] != NOT_WON:
+                    continue
+                weak_dtm[index] = ply
+                origins = [(king, piece_sq) for king in KING_NEIGHBORS[strong_king] if king != piece_sq]
+                if piece_class is Pawn:
+                    origins += [(strong_king, sq) for sq in pawn_origins(piece_sq, strong_king, weak_king)]
+                else:
+                    origins += [(strong_king, sq) for sq in slider_squares(piece_class, piece_sq, strong_king, weak_king)]
+                for king, sq in origins:
+                    origin = (king * 64 + sq) * 64 + weak_king
+                    if strong_legal[origin] and strong_dtm[origin] == NOT_WON:
+                        buckets.setdefault(ply + 1, []).append(('strong', origin))
+            else:
+                if strong_dtm[index] != NOT_WON:
+                    continue
+                strong_dtm[index] = ply
+                for king in KING_NEIGHBORS[weak_king]:
+                    origin = (strong_king * 64 + piece_sq) * 64 + king
+                    if king == piece_sq or not weak_legal[origin] or weak_dtm[origin] != NOT_WON:
+                        continue
+                    weak_moves_left[origin] -= 1
+                    if weak_moves_left[origin] == 0:
+                        buckets.setdefault(ply + 1, []).append(('weak', origin))
+        ply += 1
+    return strong_dtm, weak_dtm
+
+def table_path(table_dir, piece_class):
+    return os.path.join(table_dir, TABLE_PIECES[piece_class] + '.tb')
+
+# generates and saves the tables missing from table_dir (KQK first, KPK promotes into it); returns the
+# piece classes generated
+def generate_tables(table_dir=TABLE_DIR):
+    generated = []
+    tables = {}
+    for piece_class in (Queen, Rook, Pawn):
+        path = table_path(table_dir, piece_class)
+        if os.path.exists(path):
+            continue
+        if piece_class is Pawn and Queen not in tables:
+            tables[Queen] = load_table(table_path(table_dir, Queen))
+        tables[piece_class] = generate_table(piece_class, tables[Queen][1] if piece_class is Pawn else None)
+        os.makedirs(table_dir, exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(tables[piece_class][0] + tables[piece_class][1])
+        generated.append(piece_class)
+    return generated
+
+# (strong side to move, weak side to move) tables of a saved file
+def load_table(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    return data[:len(data) // 2], data[len(data) // 2:]
+
+# loads whichever of KQK, KRK and KPK have been generated into table_dir; it never generates them itself,
+# as that takes seconds, so positions without a table just probe as None
+class Tablebase:
+    def __init__(self, table_dir=TABLE_DIR):
+        self.table_dir = table_dir
+        self.tables = {piece_class: load_table(table_path(table_dir, piece_class)) for piece_class in TABLE_PIECES
+                       if os.path.exists(table_path(table_dir, piece_class))}
+        self.cache = {} # zobrist key -> probed score
+        self.probes = 0
+        self.hits = 0
+
+    # white's side score of a position with at most TABLEBASE_PIECES pieces: +/-(TABLEBASE_WIN - plies to
+    # mate) for a win, 0 for a draw, or None if no table covers it
+    def probe(self, board):
+        if board.piece_count > TABLEBASE_PIECES:
+            return None
+        self.probes += 1
+        key = board.zobrist_key
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+        score = self.probe_pieces(pieces_on(board), board.turn)
+        if len(self.cache) >= PROBE_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = score
+        return score
+
+    def probe_pieces(self, pieces, turn):
+        others = [(sq, piece_class, color) for sq, piece_class, color in pieces if piece_class is not King]
+        if not others:
+            return 0
+        if len(others) > 1:
+            return None
+        piece_sq, piece_class, strong = others[0]
+        if piece_class in (Knight, Bishop):
+            return 0 # a lone minor piece cannot mate
+        if piece_class not in self.tables:
+            return None
+        kings = {color: sq for sq, piece_class, color in pieces if piece_class is King}
+        squares = [kings[strong], piece_sq, kings['black' if strong == 'white' else 'white']]
+        if strong == 'black': # look at it from the other side so the strong side moves up the board
+            squares = [(7 - sq // 8) * 8 + sq % 8 for sq in squares]
+        strong_dtm, weak_dtm = self.tables[piece_class]
+        index = (squares[0] * 64 + squares[1]) * 64 + squares[2]
+        dtm = (strong_dtm if turn == strong else weak_dtm)[index]
+        if dtm == NOT_WON:
+            return 0
+        return (TABLEBASE_WIN - dtm) * (1 if strong == 'white' else -1)
+
+    # the best move by the tables for the side to move, or None if some move leads outside them
+    def best_move(self, board):
+        best_move = None
+        best_score = None
+        sign = 1 if board.turn == 'white' else -1
+        for move in board.get_all_moves(board.turn):
+            undo = board.make_move(*move)
+            score = self.probe(board)
+            board.unmake_move(undo)
+            if score is None:
+                return None
+            if best_score is None or score * sign > best_score * sign:
+                best_move, best_score = move, score
+        return best_move
+
+# (square, piece class, color) of every piece on a Board or BitBoard
+def pieces_on(board):
+    if isinstance(board, BitBoard):
+        return [(sq, BITBOARD_PIECES[code % 6], 'white' if code < 6 else 'black')
+                for sq, code in enumerate(board.squares) if code is not None]
+    return [(row * 8 + col, type(piece), piece.color) for row in range(8) for col in range(8)
+            for piece in (board.board[row][col],) if piece]
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the endgame tables the AI looks up.')
+    parser.add_argument('--dir', default=TABLE_DIR, help='where to write them')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generated = generate_tables(args.dir)
+    print(f'generated {", ".join(TABLE_PIECES[piece_class] for piece_class in generated) or "nothing"} '
+          f'in {time.perf_counter() - start:.1f}s')
+    tablebase = Tablebase(args.dir)
+    for piece_class, (strong_dtm, weak_dtm) in tablebase.tables.items():
+        won = sum(1 for dtm in strong_dtm if dtm != NOT_WON)
+        print(f'{TABLE_PIECES[piece_class]}: {won} won positions with the strong side to move, longest mate '
+              f'{max(dtm for dtm in strong_dtm if dtm != NOT_WON)} plies')
+
+if __name__ == '__main__':
+    main()
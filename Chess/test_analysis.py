@@ -0,0 +1,23 @@
+from analysis import analyse_positions, pgn_positions
+
+# the first game has an en passant capture, which the board cannot play
+PGN = '''[Event "a"]
+
+1. e4 a6 2. e5 d5 3. exd6 Qxd6 *
+
+[Event "b"]
+
+1. d4 d5 *
+'''
+
+def test_bad_move_ends_only_its_game():
+    positions = list(pgn_positions(PGN.splitlines()))
+    assert len(positions) == 7 # the four positions up to exd6, its error, then both positions of the second game
+    assert isinstance(positions[4], ValueError) and 'exd6' in str(positions[4])
+    assert all(isinstance(fen, str) for index, fen in enumerate(positions) if index != 4)
+
+def test_error_row_keeps_the_batch_going():
+    results = sorted(analyse_positions(pgn_positions(PGN.splitlines()), depth=1, processes=1), key=lambda row: row['index'])
+    assert [row['index'] for row in results] == list(range(7))
+    assert [row['index'] for row in results if row['error']] == [4]
+    assert all(row['move'] for row in results if not row['error'])
@@ -0,0 +1,68 @@
+import random
+import pytest
+from engine import Board, BitBoard, King
+from pgn import move_to_san, san_to_move
+from perft import POSITIONS
+
+# random games from the perft positions (which have castling, promotions and pins early on), checked move
+# by move against full recomputation and the other backend; run with python -m pytest Chess
+GAMES = [(name, seed) for name in POSITIONS for seed in range(2)]
+MAX_PLIES = 120
+
+# everything make_move updates, for comparing a position before and after a make/unmake round trip
+def snapshot(board):
+    pieces = [(type(piece), piece.color, piece.position, piece.has_moved, piece.code, piece.side)
+              for row in board.board for piece in row if piece]
+    return (pieces, board.turn, board.castling, board.zobrist_key, board.material, board.piece_square,
+            dict(board.king_positions), {color: list(files) for color, files in board.pawn_files.items()},
+            board.piece_count)
+
+# (board, bitboard) after each ply of a random game, the same moves played on both
+def random_game(name, seed):
+    rng = random.Random(seed)
+    board = Board.from_fen(POSITIONS[name][0])
+    bitboard = BitBoard.from_board(board)
+    for _ in range(MAX_PLIES):
+        yield board, bitboard
+        moves = board.get_all_moves(board.turn)
+        if not moves or board.piece_count <= 2:
+            return
+        castles = [(start, end) for start, end in moves if board.piece_class_at(*start) is King and abs(start[1] - end[1]) == 2]
+        move = rng.choice(castles if castles and rng.random() < 0.5 else moves) # rarely picked at random otherwise
+        board.make_move(*move)
+        bitboard.make_move(*move)
+
+@pytest.mark.parametrize('name, seed', GAMES)
+def test_make_unmake_restores_position(name, seed):
+    for board, _ in random_game(name, seed):
+        before = snapshot(board)
+        for move in board.get_all_moves(board.turn):
+            undo = board.make_move(*move)
+            board.unmake_move(undo)
+            assert snapshot(board) == before, move
+
+@pytest.mark.parametrize('name, seed', GAMES)
+def test_incremental_state_matches_recomputation(name, seed):
+    for board, bitboard in random_game(name, seed):
+        assert board.zobrist_key == board.compute_zobrist_key()
+        assert (board.material, board.piece_square) == board.compute_static_scores()
+        assert (bitboard.material, bitboard.piece_square) == bitboard.compute_static_scores()
+        assert bitboard.zobrist_key == board.zobrist_key
+        assert bitboard.castling == board.castling
+
+@pytest.mark.parametrize('name, seed', GAMES)
+def test_board_and_bitboard_generate_the_same_moves(name, seed):
+    for board, bitboard in random_game(name, seed):
+        assert sorted(bitboard.get_all_moves(board.turn)) == sorted(board.get_all_moves(board.turn))
+        assert board.is_in_check(board.turn) == bitboard.is_in_check(board.turn)
+
+@pytest.mark.parametrize('name, seed', GAMES)
+def test_san_and_fen_round_trip(name, seed):
+    for board, _ in random_game(name, seed):
+        fen = board.to_fen()
+        copy = Board.from_fen(fen)
+        assert copy.to_fen() == fen
+        assert copy.zobrist_key == board.zobrist_key
+        assert sorted(copy.get_all_moves(copy.turn)) == sorted(board.get_all_moves(board.turn))
+        for move in board.get_all_moves(board.turn):
+            assert san_to_move(board, move_to_san(board, move)) == move
@@ -0,0 +1,39 @@
+import io
+import pytest
+from uci import UCIEngine
+
+# sends each command line to a new engine and returns its output lines
+def run_commands(*lines):
+    output = io.StringIO()
+    engine = UCIEngine(output)
+    for line in lines:
+        engine.handle(line.split())
+    engine.stop_search()
+    engine.ai.close()
+    return output.getvalue().splitlines(), engine
+
+@pytest.mark.parametrize('position', [
+    'position startpos moves e2e4 0000', # null move
+    'position startpos moves e2', # malformed move
+    'position startpos moves e2e4 a7a6 e4e5 d7d5 e5d6', # en passant
+    'position fen 1k6/P7/8/8/8/8/8/K7 w - - 0 1 moves a7a8n', # under-promotion
+    'position startpos moves e2e5', # illegal move
+    'position fen rnbqkbnr/pppppppp/8/8 w KQkq - 0 1', # too few ranks
+    'position fen rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', # unknown piece
+    'position fen', # no FEN at all
+])
+def test_bad_position_is_refused(position):
+    lines, engine = run_commands(position, 'go depth 1')
+    assert engine.board is None
+    assert lines[0].startswith('info string')
+    assert lines[-1] == 'bestmove 0000'
+
+def test_position_after_a_refused_one_is_searched():
+    lines, engine = run_commands('position startpos moves e2e4 0000', 'position startpos moves e2e4 e7e5 g1f3', 'go depth 1')
+    assert engine.board.turn == 'black'
+    assert lines[-1].startswith('bestmove') and lines[-1] != 'bestmove 0000'
+
+def test_queen_promotion_is_played():
+    lines, engine = run_commands('position fen 1k6/P7/8/8/8/8/8/K7 w - - 0 1 moves a7a8q')
+    assert not lines
+    assert engine.board.to_fen().startswith('Qk6/')
@@ -0,0 +1,178 @@
+import re
+import sys
+import threading
+from engine import Board, ChessAI, TranspositionTable, parse_square, move_name
+from tablebase import Tablebase
+
+ENGINE_NAME = 'Chess'
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+MOVE_PATTERN = re.compile(r'^([a-h][1-8])([a-h][1-8])q?$') # long algebraic, promoting to a queen if at all
+
+# speaks the UCI protocol on stdin/stdout; commands are read on the main thread while the search runs
+# on its own thread, so stop and isready are answered straight away
+class UCIEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.ai = ChessAI('white', hash_mb=self.hash_mb, tablebase=Tablebase())
+        self.ai.on_iteration = self.send_info
+        self.board = Board()
+        self.search_thread = None
+        self.stop_requested = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def run(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line.split()):
+                break
+        self.stop_search()
+        self.ai.close()
+
+    # returns False on quit
+    def handle(self, tokens):
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}')
+            self.send(f'option name Threads type spin default 1 min 1 max {MAX_THREADS}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.ai.tt.clear()
+            self.ai.close() # the workers' tables are cleared by starting them again
+            self.board = Board()
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'quit':
+            return False
+        return True
+
+    # setoption name Hash value 64, setoption name Threads value 4 (processes searching the root moves)
+    def set_option(self, args):
+        if 'name' not in args or 'value' not in args:
+            return
+        name = ' '.join(args[args.index('name') + 1:args.index('value')])
+        value = ' '.join(args[args.index('value') + 1:])
+        if name.lower() not in ('hash', 'threads'):
+            return
+        try:
+            number = int(value)
+        except ValueError: # a bad value leaves the option as it was
+            self.send(f'info string invalid value {value} for option {name}')
+            return
+        self.stop_search()
+        self.ai.close() # the workers are started again with the new settings
+        if name.lower() == 'hash':
+            self.hash_mb = max(1, min(MAX_HASH_MB, number))
+            self.ai.tt = TranspositionTable(self.hash_mb)
+        else:
+            self.ai.workers = max(1, min(MAX_THREADS, number))
+
+    # position startpos|fen <fen> [moves e2e4 ...]; a position the board cannot set up (a bad FEN, or a
+    # move it cannot play, such as en passant or an under-promotion) leaves no position, and go refuses
+    # to search until the next position command
+    def set_position(self, args):
+        self.board = None
+        moves = args.index('moves') if 'moves' in args else len(args)
+        try:
+            board = Board.from_fen(' '.join(args[1:moves])) if args and args[0] == 'fen' else Board()
+        except ValueError as error:
+            self.send(f'info string {error}, no position set')
+            return
+        for text in args[moves + 1:]:
+            match = MOVE_PATTERN.match(text)
+            if not match or not board.move_piece(parse_square(match[1]), parse_square(match[2]))[0]:
+                self.send(f'info string illegal or unsupported move {text}, no position set')
+                return
+        self.board = board
+
+    def go(self, args):
+        if self.board is None:
+            self.send('info string no position to search')
+            self.send('bestmove 0000')
+            return
+        limits = {}
+        for name, value in zip(args, args[1:]):
+            if name in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc') and value.lstrip('-').isdigit():
+                limits[name] = int(value)
+        infinite = 'infinite' in args
+        color = self.board.turn
+        time_left = limits.get('wtime' if color == 'white' else 'btime')
+        increment = limits.get('winc' if color == 'white' else 'binc', 0) / 1000
+
+        if infinite or (time_left is None and 'movetime' not in limits):
+            move_time = float('inf') # search until stopped (or up to the given depth)
+        elif 'movetime' in limits:
+            move_time = limits['movetime'] / 1000
+        else:
+            move_time = None
+        search_args = (self.board, time_left / 1000 if time_left is not None else float('inf'), increment, move_time,
+                       limits.get('depth'), infinite)
+
+        self.ai.color = color
+        self.stop_requested.clear()
+        self.search_thread = threading.Thread(target=self.search, args=search_args, daemon=True)
+        self.search_thread.start()
+
+    def search(self, board, time_left, increment, move_time, max_depth, infinite):
+        move = self.ai.choose_move(board, time_left, increment, move_time, max_depth)
+        if infinite:
+            self.stop_requested.wait() # bestmove only once the GUI says stop
+        self.send('bestmove ' + (move_name(board, move) if move else '0000'))
+
+    def stop_search(self):
+        self.stop_requested.set()
+        while self.search_thread and self.search_thread.is_alive():
+            self.ai.stop() # repeated in case the search had not started when first asked
+            self.search_thread.join(0.005)
+        self.search_thread = None
+
+    # score is from white's side; UCI wants it from the side to move, with a forced mate as "mate N"
+    def send_info(self, board, depth, score, seconds, pv):
+        if self.ai.color == 'black':
+            score = -score
+        if score in (float('inf'), float('-inf')):
+            moves = (len(pv) + 1) // 2
+            score_text = f'mate {moves if score > 0 else -moves}'
+        else:
+            score_text = f'cp {int(score)}'
+        nodes = self.ai.nodes
+        nps = int(nodes / seconds) if seconds > 0 else 0
+        line = ' '.join(move_name_along(board, pv))
+        self.send(f'info depth {depth} score {score_text} nodes {nodes} nps {nps} time {int(seconds * 1000)} pv {line}')
+
+# coordinate names of a line of moves played from board, which is left unchanged
+def move_name_along(board, moves):
+    names = []
+    undos = []
+    for move in moves:
+        names.append(move_name(board, move))
+        undos.append(board.make_move(*move))
+    for undo in reversed(undos):
+        board.unmake_move(undo)
+    return names
+
+def main():
+    UCIEngine().run()
+
+if __name__ == '__main__':
+    main()